@@ -1,16 +1,20 @@
 #!/usr/bin/env python3
 import os
-import re
-import sys
 import json
+import mmap
+import queue
 import logging
+import threading
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox, scrolledtext
-from bs4 import BeautifulSoup
-from pathlib import Path
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Import the HTML extractor functionality
-from html_extractor import extract_code_from_html
+from html_extractor import collect_code_blocks, write_code_blocks
 
 # Set up logging
 logging.basicConfig(
@@ -19,6 +23,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Metadata files larger than this are memory-mapped instead of read
+METADATA_MMAP_THRESHOLD = 64 * 1024
+
+# Number of archives added to the list per idle callback
+ARCHIVE_LIST_BATCH_SIZE = 500
+
+# Milliseconds between progress bar updates during extraction
+PROGRESS_POLL_MS = 50
+
+# Milliseconds between checks for the result of a background archive listing
+LIST_POLL_MS = 50
+
+def _load_json(data):
+    """
+    Parse JSON from a bytes-like object, using orjson when it is installed.
+    
+    Args:
+        data: bytes, bytearray or memoryview with the JSON document
+        
+    Returns:
+        The parsed JSON value
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(bytes(data))
+
 class HTMLArchiveExtractor:
     """
     A class for extracting code from HTML archives created by the HTML Code Saver.
@@ -35,15 +65,73 @@ class HTMLArchiveExtractor:
         self.archive_dir = archive_dir
         self.output_dir = output_dir or os.path.join(os.path.expanduser("~"), "Desktop", "WEB-CODES")
         
+        # Parsed metadata keyed by path, stored as ((st_mtime_ns, st_size), metadata)
+        self._metadata_cache = {}
+        
         # Create output directory if it doesn't exist
         os.makedirs(self.output_dir, exist_ok=True)
     
-    def extract_from_archive(self, archive_dir=None):
+    def _load_metadata(self, archive_dir):
+        """
+        Load the metadata of an HTML archive, reusing the cached copy if unchanged.
+        
+        Args:
+            archive_dir (str): Path to the HTML archive directory
+            
+        Returns:
+            dict: Archive metadata, or None if it cannot be read
+        """
+        metadata_path = os.path.join(archive_dir, "metadata.json")
+        try:
+            stat = os.stat(metadata_path)
+        except OSError:
+            logger.error(f"Metadata file not found in archive: {metadata_path}")
+            return None
+        
+        # The size catches rewrites within the timestamp resolution of coarse filesystems
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self._metadata_cache.get(metadata_path)
+        if cached and cached[0] == version:
+            return cached[1]
+        
+        try:
+            with open(metadata_path, 'rb') as f:
+                if stat.st_size > METADATA_MMAP_THRESHOLD:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        with memoryview(mm) as view:
+                            metadata = _load_json(view)
+                else:
+                    metadata = _load_json(f.read())
+        except Exception as e:
+            logger.error(f"Error reading metadata file: {e}")
+            return None
+        
+        self._metadata_cache[metadata_path] = (version, metadata)
+        return metadata
+    
+    def _find_html_file(self, archive_dir):
+        """
+        Find the HTML file stored in an HTML archive.
+        
+        Args:
+            archive_dir (str): Path to the HTML archive directory
+            
+        Returns:
+            str: Name of the first HTML file in the archive, or None
+        """
+        with os.scandir(archive_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(('.html', '.htm')) and entry.is_file():
+                    return entry.name
+        return None
+    
+    def extract_from_archive(self, archive_dir=None, progress_callback=None):
         """
         Extract code from an HTML archive.
         
         Args:
             archive_dir (str, optional): Path to the HTML archive directory
+            progress_callback (callable, optional): Called with the percentage of files written
             
         Returns:
             list: List of created file paths
@@ -59,28 +147,24 @@ class HTMLArchiveExtractor:
             return []
         
         # Load metadata
-        metadata_path = os.path.join(archive_dir, "metadata.json")
-        if not os.path.exists(metadata_path):
-            logger.error(f"Metadata file not found in archive: {metadata_path}")
-            return []
-        
-        try:
-            with open(metadata_path, 'r', encoding='utf-8') as f:
-                metadata = json.load(f)
-        except Exception as e:
-            logger.error(f"Error reading metadata file: {e}")
+        metadata = self._load_metadata(archive_dir)
+        if metadata is None:
             return []
         
         # Find HTML file in archive
-        html_files = [f for f in os.listdir(archive_dir) if f.endswith(('.html', '.htm'))]
-        if not html_files:
+        html_file = self._find_html_file(archive_dir)
+        if not html_file:
             logger.error(f"No HTML files found in archive: {archive_dir}")
             return []
         
-        html_file_path = os.path.join(archive_dir, html_files[0])
+        html_file_path = os.path.join(archive_dir, html_file)
         
         # Extract code from HTML file
-        return extract_code_from_html(html_file_path, self.output_dir)
+        code_blocks = collect_code_blocks(html_file_path, metadata.get("selectors"))
+        if not code_blocks:
+            return []
+        
+        return write_code_blocks(code_blocks, self.output_dir, progress_callback)
     
     def list_archives(self, archives_dir=None):
         """
@@ -90,7 +174,7 @@ class HTMLArchiveExtractor:
             archives_dir (str, optional): Directory containing HTML archives
             
         Returns:
-            list: List of archive directories
+            list: List of archive directories, most recently modified first
         """
         archives_dir = archives_dir or os.path.join(os.path.expanduser("~"), "Desktop", "HTML-ARCHIVES")
         
@@ -100,12 +184,20 @@ class HTMLArchiveExtractor:
         
         # Find all subdirectories that contain metadata.json
         archives = []
-        for item in os.listdir(archives_dir):
-            item_path = os.path.join(archives_dir, item)
-            if os.path.isdir(item_path) and os.path.exists(os.path.join(item_path, "metadata.json")):
-                archives.append(item_path)
-        
-        return archives
+        with os.scandir(archives_dir) as entries:
+            for entry in entries:
+                # Directories, or symlinks to directories, holding a metadata file; symlinks are
+                # followed as os.path.isdir did, and the results are cached on the entry
+                if not entry.is_dir() or not os.path.isfile(os.path.join(entry.path, "metadata.json")):
+                    continue
+                try:
+                    archives.append((entry.stat().st_mtime_ns, entry.path))
+                except OSError:
+                    # Removed while listing
+                    continue
+        
+        archives.sort(key=lambda archive: archive[0], reverse=True)
+        return [path for _, path in archives]
     
     def get_archive_info(self, archive_dir):
         """
@@ -117,36 +209,24 @@ class HTMLArchiveExtractor:
         Returns:
             dict: Archive information
         """
-        if not os.path.isdir(archive_dir):
-            logger.error(f"Archive directory does not exist: {archive_dir}")
-            return None
-        
-        # Load metadata
-        metadata_path = os.path.join(archive_dir, "metadata.json")
-        if not os.path.exists(metadata_path):
-            logger.error(f"Metadata file not found in archive: {metadata_path}")
-            return None
-        
-        try:
-            with open(metadata_path, 'r', encoding='utf-8') as f:
-                metadata = json.load(f)
-        except Exception as e:
-            logger.error(f"Error reading metadata file: {e}")
+        # Load metadata; this also fails if the archive directory is gone
+        metadata = self._load_metadata(archive_dir)
+        if metadata is None:
             return None
         
         # Load preview
         preview_path = os.path.join(archive_dir, "preview.txt")
         preview = ""
-        if os.path.exists(preview_path):
-            try:
-                with open(preview_path, 'r', encoding='utf-8') as f:
-                    preview = f.read()
-            except Exception as e:
-                logger.warning(f"Error reading preview file: {e}")
+        try:
+            with open(preview_path, 'r', encoding='utf-8') as f:
+                preview = f.read()
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Error reading preview file: {e}")
         
         # Find HTML file in archive
-        html_files = [f for f in os.listdir(archive_dir) if f.endswith(('.html', '.htm'))]
-        html_file = html_files[0] if html_files else None
+        html_file = self._find_html_file(archive_dir)
         
         return {
             "name": os.path.basename(archive_dir),
@@ -185,15 +265,15 @@ class HTMLArchiveExtractorApp:
         list_frame = ttk.Frame(archives_frame)
         list_frame.pack(fill=tk.BOTH, expand=True)
         
-        # Create scrollable listbox for archives
-        self.archives_listbox = tk.Listbox(list_frame, height=10)
-        self.archives_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
-        self.archives_listbox.bind('<<ListboxSelect>>', self.on_archive_select)
+        # Create scrollable tree view for archives, keyed by archive path
+        self.archives_tree = ttk.Treeview(list_frame, show="tree", selectmode="browse", height=10)
+        self.archives_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.archives_tree.bind('<<TreeviewSelect>>', self.on_archive_select)
         
-        # Add scrollbar to listbox
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.archives_listbox.yview)
+        # Add scrollbar to tree view
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.archives_tree.yview)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.archives_listbox.config(yscrollcommand=scrollbar.set)
+        self.archives_tree.config(yscrollcommand=scrollbar.set)
         
         # Create buttons for archive actions
         button_frame = ttk.Frame(archives_frame)
@@ -225,31 +305,90 @@ class HTMLArchiveExtractorApp:
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill=tk.X, pady=20)
         
-        ttk.Button(button_frame, text="Extract Code", command=self.extract_code).pack(side=tk.LEFT, padx=5)
+        self.extract_button = ttk.Button(button_frame, text="Extract Code", command=self.extract_code)
+        self.extract_button.pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Exit", command=self.root.destroy).pack(side=tk.RIGHT, padx=5)
         
-        # Create the status bar
+        # Create the status bar with extraction progress
+        status_frame = ttk.Frame(root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        
         self.status_var = tk.StringVar(value="Ready")
-        status_bar = ttk.Label(root, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
-        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        status_bar = ttk.Label(status_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
+        status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        self.progress_var = tk.DoubleVar()
+        self.progress_bar = ttk.Progressbar(status_frame, variable=self.progress_var, length=100, mode='determinate')
+        self.progress_bar.pack(side=tk.RIGHT, padx=5)
+        
+        # Progress values pushed by the extraction thread, then its (handler, args) result;
+        # applied on the Tk thread by _poll_progress
+        self.progress_queue = queue.Queue()
+        
+        # (generation, archives) results pushed by listing threads, applied by _poll_archive_list
+        self.list_queue = queue.Queue()
         
-        # Initialize archive list
-        self.archives = []
         self.selected_archive = None
+        # Incremented on every refresh so stale list updates are dropped
+        self._refresh_generation = 0
+        # Archive information keyed by path, stored as (version from _archive_info_version, info)
+        self._archive_info_cache = {}
         self.refresh_archives()
     
     def refresh_archives(self):
-        """Refresh the list of available archives."""
-        self.archives = self.extractor.list_archives()
+        """Refresh the list of available archives in a background thread."""
+        self._refresh_generation += 1
+        generation = self._refresh_generation
+        
+        self.status_var.set("Loading archives...")
+        
+        def list_thread():
+            archives = self.extractor.list_archives()
+            
+            # Tk is only touched from its own thread; _poll_archive_list picks the result up
+            self.list_queue.put((generation, archives))
+        
+        threading.Thread(target=list_thread, daemon=True).start()
+        self.root.after(LIST_POLL_MS, self._poll_archive_list)
+    
+    def _poll_archive_list(self):
+        """Show the archives found by a listing thread, polling again until one has finished."""
+        try:
+            generation, archives = self.list_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(LIST_POLL_MS, self._poll_archive_list)
+            return
         
-        # Clear listbox
-        self.archives_listbox.delete(0, tk.END)
+        self._populate_archives(generation, archives, 0)
+    
+    def _populate_archives(self, generation, archives, start):
+        """
+        Add a batch of archives to the list, scheduling the next batch when idle.
+        
+        Args:
+            generation (int): Refresh the archives were listed for
+            archives (list): Archive directories to show
+            start (int): Index of the first archive in this batch
+        """
+        if generation != self._refresh_generation:
+            return
+        
+        if start == 0:
+            # Forget archives that are no longer listed
+            listed = set(archives)
+            self._archive_info_cache = {archive: cached for archive, cached in self._archive_info_cache.items()
+                                        if archive in listed}
+            
+            self.archives_tree.delete(*self.archives_tree.get_children())
         
-        # Add archives to listbox
-        for archive in self.archives:
-            self.archives_listbox.insert(tk.END, os.path.basename(archive))
+        end = start + ARCHIVE_LIST_BATCH_SIZE
+        for archive in archives[start:end]:
+            self.archives_tree.insert('', tk.END, iid=archive, text=os.path.basename(archive))
         
-        self.status_var.set(f"Found {len(self.archives)} archives")
+        if end < len(archives):
+            self.root.after_idle(self._populate_archives, generation, archives, end)
+        else:
+            self.status_var.set(f"Found {len(archives)} archives")
     
     def browse_archive(self):
         """Browse for an HTML archive directory."""
@@ -260,11 +399,10 @@ class HTMLArchiveExtractorApp:
         if dir_path:
             # Check if it's a valid archive
             if os.path.exists(os.path.join(dir_path, "metadata.json")):
-                self.archives.append(dir_path)
-                self.archives_listbox.insert(tk.END, os.path.basename(dir_path))
-                self.archives_listbox.selection_clear(0, tk.END)
-                self.archives_listbox.selection_set(tk.END)
-                self.archives_listbox.see(tk.END)
+                if not self.archives_tree.exists(dir_path):
+                    self.archives_tree.insert('', tk.END, iid=dir_path, text=os.path.basename(dir_path))
+                self.archives_tree.selection_set(dir_path)
+                self.archives_tree.see(dir_path)
                 self.on_archive_select(None)
             else:
                 messagebox.showerror("Error", f"Not a valid HTML archive: {dir_path}")
@@ -281,23 +419,54 @@ class HTMLArchiveExtractorApp:
     
     def on_archive_select(self, event):
         """Handle archive selection event."""
-        selection = self.archives_listbox.curselection()
+        selection = self.archives_tree.selection()
         if not selection:
             return
         
-        index = selection[0]
-        if index < 0 or index >= len(self.archives):
-            return
-        
-        self.selected_archive = self.archives[index]
+        # Archive information is only loaded for the selected row
+        self.selected_archive = selection[0]
         self.update_archive_info()
     
+    def _archive_info_version(self, archive_dir):
+        """
+        Identify the current version of the files the archive information is read from.
+        
+        Files rewritten in place do not change the archive directory's mtime, so the
+        metadata and preview files are checked themselves.
+        
+        Args:
+            archive_dir (str): Path to the HTML archive directory
+            
+        Returns:
+            tuple: (st_mtime_ns, st_size) of metadata.json and preview.txt, None for a missing file
+        """
+        version = []
+        for name in ("metadata.json", "preview.txt"):
+            try:
+                stat = os.stat(os.path.join(archive_dir, name))
+            except OSError:
+                version.append(None)
+            else:
+                version.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(version)
+    
     def update_archive_info(self):
         """Update the archive information display."""
         if not self.selected_archive:
             return
         
-        archive_info = self.extractor.get_archive_info(self.selected_archive)
+        # Taken before loading, so a file rewritten while it is read is reloaded next time
+        version = self._archive_info_version(self.selected_archive)
+        cached = self._archive_info_cache.get(self.selected_archive)
+        if cached and cached[0] == version:
+            archive_info = cached[1]
+        else:
+            archive_info = self.extractor.get_archive_info(self.selected_archive)
+            if archive_info:
+                self._archive_info_cache[self.selected_archive] = (version, archive_info)
+            else:
+                self._archive_info_cache.pop(self.selected_archive, None)
+        
         if not archive_info:
             self.info_text.config(state=tk.NORMAL)
             self.info_text.delete(1.0, tk.END)
@@ -336,21 +505,75 @@ class HTMLArchiveExtractorApp:
         
         # Update status
         self.status_var.set("Extracting code...")
-        self.root.update()
+        self.progress_var.set(0)
+        self.extract_button.config(state=tk.DISABLED)
         
-        # Extract code
-        try:
-            files_created = self.extractor.extract_from_archive(self.selected_archive)
-            
-            if files_created:
-                self.status_var.set(f"Extracted {len(files_created)} files")
-                messagebox.showinfo("Success", f"Successfully extracted {len(files_created)} files to {self.extractor.output_dir}")
+        # Extract in the background so the window stays responsive
+        threading.Thread(target=self._extract_worker, args=(self.selected_archive,), daemon=True).start()
+        self.root.after(PROGRESS_POLL_MS, self._poll_progress)
+    
+    def _poll_progress(self):
+        """Apply the latest progress value queued by the extraction thread, until its result arrives."""
+        value = None
+        result = None
+        while True:
+            try:
+                queued = self.progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(queued, tuple):
+                result = queued
             else:
-                self.status_var.set("No files extracted")
-                messagebox.showwarning("Warning", "No files were extracted. Check the archive contents.")
+                value = queued
+        
+        if value is not None:
+            self.progress_var.set(value)
+        if result is None:
+            self.root.after(PROGRESS_POLL_MS, self._poll_progress)
+        else:
+            handler, args = result
+            handler(*args)
+    
+    def _extract_worker(self, archive_dir):
+        """
+        Extract code from an archive, queueing progress and the result for the Tk thread.
+        
+        Args:
+            archive_dir (str): Path to the HTML archive directory
+        """
+        try:
+            files_created = self.extractor.extract_from_archive(archive_dir, progress_callback=self.progress_queue.put)
         except Exception as e:
-            self.status_var.set("Error extracting code")
-            messagebox.showerror("Error", f"Error extracting code: {str(e)}")
+            self.progress_queue.put((self.extraction_error, (str(e),)))
+        else:
+            self.progress_queue.put((self.extraction_complete, (files_created,)))
+    
+    def extraction_complete(self, files_created):
+        """
+        Report the result of a finished extraction.
+        
+        Args:
+            files_created (list): List of created file paths
+        """
+        self.extract_button.config(state=tk.NORMAL)
+        
+        if files_created:
+            self.status_var.set(f"Extracted {len(files_created)} files")
+            messagebox.showinfo("Success", f"Successfully extracted {len(files_created)} files to {self.extractor.output_dir}")
+        else:
+            self.status_var.set("No files extracted")
+            messagebox.showwarning("Warning", "No files were extracted. Check the archive contents.")
+    
+    def extraction_error(self, error_message):
+        """
+        Report an extraction that failed with an exception.
+        
+        Args:
+            error_message (str): Description of the error
+        """
+        self.extract_button.config(state=tk.NORMAL)
+        self.status_var.set("Error extracting code")
+        messagebox.showerror("Error", f"Error extracting code: {error_message}")
 
 def main():
     """Main function to run the application."""
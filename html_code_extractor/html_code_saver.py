@@ -1,15 +1,21 @@
 #!/usr/bin/env python3
 import os
-import re
-import sys
 import json
+import queue
 import shutil
 import logging
 import datetime
+import threading
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox, scrolledtext
-from bs4 import BeautifulSoup
-from pathlib import Path
+from lxml import etree
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from html_extractor import sniff_encoding
 
 # Set up logging
 logging.basicConfig(
@@ -18,6 +24,259 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Classes identifying file path headers, code tables and added code lines
+FILE_PATH_CLASS = "text-sm text-zinc-400 mb-2 font-mono"
+CODE_TABLE_CLASS = "syntax-highlight"
+CODE_LINE_CLASS = "line added"
+
+# Like CSS class selectors, an element matches when it has all of the classes, in any order
+FILE_PATH_CLASSES = frozenset(FILE_PATH_CLASS.split())
+CODE_TABLE_CLASSES = frozenset(CODE_TABLE_CLASS.split())
+CODE_LINE_CLASSES = frozenset(CODE_LINE_CLASS.split())
+
+# Text inside these elements is not part of an element's visible text
+HIDDEN_TEXT_TAGS = frozenset(('script', 'style', 'template'))
+
+# Bytes or characters fed to the parser at a time
+PARSE_CHUNK_SIZE = 64 * 1024
+
+# Number of preview lines added to the preview box per idle callback
+PREVIEW_BATCH_SIZE = 500
+
+# Milliseconds between checks for results handed back by worker threads
+RESULT_POLL_MS = 50
+
+def _read_events(parser, html):
+    """
+    Feed HTML to a pull parser chunk by chunk and yield its parse events.
+    
+    Args:
+        parser (etree.HTMLPullParser): Parser reporting start and end events
+        html (bytes or str): HTML content
+    
+    Yields:
+        tuple: (event, element)
+    """
+    for start in range(0, len(html), PARSE_CHUNK_SIZE):
+        parser.feed(html[start:start + PARSE_CHUNK_SIZE])
+        yield from parser.read_events()
+    
+    try:
+        parser.close()
+    except etree.XMLSyntaxError:
+        # Raised for documents without any element, which have nothing to report
+        pass
+    yield from parser.read_events()
+
+def _classify_element(element):
+    """
+    Check whether an element is a file path header or a code table.
+    
+    Args:
+        element: lxml element
+        
+    Returns:
+        str: "header", "table" or None
+    """
+    classes = element.get('class')
+    if not classes:
+        return None
+    
+    classes = classes.split()
+    if FILE_PATH_CLASSES.issubset(classes):
+        return "header"
+    if element.tag == 'table' and CODE_TABLE_CLASSES.issubset(classes):
+        return "table"
+    return None
+
+def _element_text(element, parts=None):
+    """
+    Get the visible text of an element and its descendants.
+    
+    Comments and the content of script, style and template elements are left out.
+    
+    Args:
+        element: lxml element
+        parts (list, optional): List the text pieces are appended to
+        
+    Returns:
+        str: Text content without the element's tail
+    """
+    text_parts = [] if parts is None else parts
+    if element.text:
+        text_parts.append(element.text)
+    for child in element:
+        # Comments and processing instructions have no string tag
+        if isinstance(child.tag, str) and child.tag not in HIDDEN_TEXT_TAGS:
+            _element_text(child, text_parts)
+        if child.tail:
+            text_parts.append(child.tail)
+    
+    if parts is None:
+        return ''.join(text_parts)
+
+def _is_code_line(row):
+    """
+    Check whether a table row is an added code line.
+    
+    Args:
+        row: lxml tr element
+        
+    Returns:
+        bool: True if the row has all of the code line classes
+    """
+    classes = row.get('class')
+    return bool(classes) and CODE_LINE_CLASSES.issubset(classes.split())
+
+def _lacks_file_headers(html_data, encoding):
+    """
+    Cheaply check whether raw HTML cannot contain any file path header.
+    
+    The header class names are searched for in the bytes. Only ASCII-compatible
+    encodings are checked; for any other encoding the page might have headers.
+    
+    Args:
+        html_data (bytes): Raw HTML
+        encoding (str): Encoding of the HTML
+        
+    Returns:
+        bool: True if some header class name does not occur anywhere in the page
+    """
+    if '<a'.encode(encoding, 'replace') != b'<a':
+        return False
+    return any(name.encode('ascii') not in html_data for name in FILE_PATH_CLASSES)
+
+def scan_title(html, encoding=None):
+    """
+    Find the page title, parsing no further than the end of the first <title>.
+    
+    Args:
+        html (bytes or str): HTML content
+        encoding (str, optional): Encoding of bytes content
+        
+    Returns:
+        str: Title, or None if the page has no <title>
+    """
+    parser = etree.HTMLPullParser(events=('end',), tag='title', encoding=encoding, huge_tree=True)
+    for _, element in _read_events(parser, html):
+        return element.text or ""
+    return None
+
+def scan_html(html, encoding=None):
+    """
+    Find the page title and the code files in HTML, counting their lines, in a single streaming pass.
+    
+    Every file path header gets the first code table that starts after it.
+    Code lines are counted as their start tags arrive, and elements are cleared
+    as soon as they have been consumed, so the document is never held as a
+    whole tree and no subtree is walked twice.
+    
+    Args:
+        html (bytes or str): HTML content
+        encoding (str, optional): Encoding of bytes content
+        
+    Returns:
+        tuple: (title, or None if the page has no <title>; [file path, line count]
+            for each file path header, in document order; parser error log)
+    """
+    title = None
+    code_files = []
+    # Headers still waiting for the next code table
+    pending_files = []
+    # Open headers and their entries in code_files
+    open_headers = {}
+    # Open code tables claimed by headers, and those headers
+    open_tables = {}
+    
+    parser = etree.HTMLPullParser(events=('start', 'end'), encoding=encoding, huge_tree=True)
+    for event, element in _read_events(parser, html):
+        kind = _classify_element(element)
+        
+        if event == 'start':
+            if kind == "header":
+                # The path is filled in once the header's text is complete
+                code_file = ["", 0]
+                code_files.append(code_file)
+                pending_files.append(code_file)
+                open_headers[element] = code_file
+            elif kind == "table" and pending_files:
+                open_tables[element] = pending_files
+                pending_files = []
+            
+            # Rows of nested tables count for every enclosing claimed table
+            if open_tables and element.tag == 'tr' and _is_code_line(element):
+                for claimed_by in open_tables.values():
+                    for code_file in claimed_by:
+                        code_file[1] += 1
+            continue
+        
+        if kind == "header":
+            # Extract file path, removing the trailing colon
+            file_path = _element_text(element).strip()
+            if file_path[-1:] == ':':
+                file_path = file_path[:-1]
+            open_headers.pop(element)[0] = file_path
+        elif kind == "table":
+            open_tables.pop(element, None)
+        
+        # Only the first title counts, as with BeautifulSoup's soup.title
+        if title is None and element.tag == 'title':
+            title = element.text or ""
+        
+        # Drop consumed elements unless an enclosing header still needs its text
+        if not open_headers:
+            element.clear(keep_tail=True)
+            # Content after </html> can produce a second root element without a parent
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+    
+    return title, code_files, parser.feed_error_log
+
+def _write_bytes(path, data):
+    """
+    Write bytes to a file with unbuffered writes on a raw file descriptor.
+    
+    Args:
+        path (str): Path of the file to create or overwrite
+        data (bytes): Data to write
+    """
+    data = memoryview(data)
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0) | getattr(os, 'O_CLOEXEC', 0)
+    fd = os.open(path, flags, 0o666)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+def _write_text(path, text):
+    """
+    Write text as UTF-8 with a single write, translating newlines like a text-mode file.
+    
+    Args:
+        path (str): Path of the file to create or overwrite
+        text (str): Text to write
+    """
+    if os.linesep != '\n':
+        text = text.replace('\n', os.linesep)
+    _write_bytes(path, text.encode('utf-8'))
+
+def _dump_json(value):
+    """
+    Serialize a value as indented JSON, using orjson when it is installed.
+    
+    Args:
+        value: JSON-serializable value
+        
+    Returns:
+        bytes: UTF-8 encoded JSON document
+    """
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_INDENT_2)
+    return json.dumps(value, indent=2).encode('utf-8')
+
 class HTMLCodeSaver:
     """
     A class for saving HTML files in a format optimized for later code extraction.
@@ -35,6 +294,9 @@ class HTMLCodeSaver:
         self.html_file_path = html_file_path
         self.save_dir = save_dir or os.path.join(os.path.expanduser("~"), "Desktop", "HTML-ARCHIVES")
         
+        # Key and result of the last file scan, shared by preview and save
+        self._last_scan = None
+        
         # Create save directory if it doesn't exist
         os.makedirs(self.save_dir, exist_ok=True)
     
@@ -56,27 +318,18 @@ class HTMLCodeSaver:
             return None
         
         try:
-            # Read HTML file
-            with open(html_file_path, 'r', encoding='utf-8') as file:
-                html_content = file.read()
-        except UnicodeDecodeError:
-            # Try with different encoding if utf-8 fails
-            try:
-                with open(html_file_path, 'r', encoding='latin-1') as file:
-                    html_content = file.read()
-                logger.warning(f"Fallback to latin-1 encoding for {html_file_path}")
-            except Exception as e:
-                logger.error(f"Error reading HTML file: {e}")
-                return None
+            # Read and parse HTML file, unless the preview already did
+            html_data, encoding, fallback, title, code_files = self._scan_file(html_file_path)
         except Exception as e:
             logger.error(f"Error reading HTML file: {e}")
             return None
         
-        # Parse HTML to extract metadata
-        soup = BeautifulSoup(html_content, 'html.parser')
+        if fallback:
+            logger.warning(f"Fallback to {encoding} encoding for {html_file_path}")
         
-        # Extract title from HTML if available
-        title = soup.title.string if soup.title else os.path.basename(html_file_path)
+        # Fall back to the file name if the page has no title
+        if title is None:
+            title = os.path.basename(html_file_path)
         
         # Create timestamp for the archive
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -90,75 +343,126 @@ class HTMLCodeSaver:
         archive_dir = os.path.join(self.save_dir, archive_name)
         os.makedirs(archive_dir, exist_ok=True)
         
-        # Copy HTML file to archive
+        # Copy HTML file to archive from the bytes already read, keeping its timestamps and mode
         html_dest = os.path.join(archive_dir, os.path.basename(html_file_path))
-        shutil.copy2(html_file_path, html_dest)
+        _write_bytes(html_dest, html_data)
+        shutil.copystat(html_file_path, html_dest)
         
         # Create metadata file
         metadata = {
             "original_file": html_file_path,
             "title": title,
             "date_saved": timestamp,
-            "file_size": os.path.getsize(html_file_path),
-            "encoding": "utf-8",  # Default, may be overridden
+            "file_size": len(html_data),
+            "encoding": encoding,
             "selectors": {
-                "file_path_class": "text-sm text-zinc-400 mb-2 font-mono",
-                "code_table_class": "syntax-highlight",
-                "code_line_class": "line added"
+                "file_path_class": FILE_PATH_CLASS,
+                "code_table_class": CODE_TABLE_CLASS,
+                "code_line_class": CODE_LINE_CLASS
             }
         }
         
         # Save metadata
         metadata_path = os.path.join(archive_dir, "metadata.json")
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2)
+        _write_bytes(metadata_path, _dump_json(metadata))
         
         # Create preview of code files that will be extracted
-        preview = self._generate_preview(html_content)
+        preview = self._format_preview(code_files)
         preview_path = os.path.join(archive_dir, "preview.txt")
-        with open(preview_path, 'w', encoding='utf-8') as f:
-            f.write(preview)
+        _write_text(preview_path, preview)
         
         logger.info(f"Created HTML archive at: {archive_dir}")
         return archive_dir
     
-    def _generate_preview(self, html_content):
+    def _scan_file(self, html_file_path):
         """
-        Generate a preview of the code files that will be extracted.
+        Read and scan an HTML file, reusing the last result while the file is unchanged.
         
         Args:
-            html_content (str): HTML content
+            html_file_path (str): Path to the HTML file
             
         Returns:
-            str: Preview text
+            tuple: (raw bytes, encoding used, whether Latin-1 was used because the undeclared
+                encoding was not UTF-8, title, code files as returned by scan_html)
         """
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Find all file headers
-        file_headers = soup.find_all(class_=re.compile(r"text-sm text-zinc-400 mb-2 font-mono"))
+        stat = os.stat(html_file_path)
+        key = (os.path.abspath(html_file_path), stat.st_mtime_ns, stat.st_size)
+        
+        last_scan = self._last_scan
+        if last_scan is not None and last_scan[0] == key:
+            return last_scan[1]
+        
+        with open(html_file_path, 'rb') as file:
+            html_data = file.read()
+        
+        # Parse the bytes directly in their declared encoding
+        declared_encoding = sniff_encoding(html_data)
+        encoding = declared_encoding or 'utf-8'
+        
+        if _lacks_file_headers(html_data, encoding):
+            # Without the header classes there are no code files, so only the title is parsed
+            if declared_encoding is None:
+                try:
+                    html_data.decode('utf-8')
+                except UnicodeDecodeError:
+                    encoding = 'latin-1'
+            # libxml2 only knows Latin-1 by its ISO name
+            title, code_files = scan_title(html_data, 'iso-8859-1' if encoding == 'latin-1' else encoding), []
+        else:
+            title, code_files, error_log = scan_html(html_data, encoding)
+            
+            # Files without a declared encoding are parsed again as Latin-1 if they are not UTF-8
+            if declared_encoding is None and any(error.type_name == 'ERR_INVALID_ENCODING' for error in error_log):
+                encoding = 'latin-1'
+                title, code_files, _ = scan_html(html_data, 'iso-8859-1')
+        
+        result = (html_data, encoding, declared_encoding is None and encoding == 'latin-1', title, code_files)
+        self._last_scan = (key, result)
+        return result
+    
+    def preview_html_file(self, html_file_path):
+        """
+        Generate the preview lines for an HTML file, keeping the scan for a following save.
         
-        if not file_headers:
-            return "No code files found in HTML."
+        Args:
+            html_file_path (str): Path to the HTML file
+            
+        Returns:
+            list: Preview lines
+        """
+        code_files = self._scan_file(html_file_path)[-1]
+        return list(self._preview_lines(code_files))
+    
+    def _format_preview(self, code_files):
+        """
+        Format the preview text for the code files found by scan_html.
         
-        preview_lines = ["Files that will be extracted:", ""]
+        Args:
+            code_files (list): [file path, line count] for each file path header
+            
+        Returns:
+            str: Preview text
+        """
+        return "\n".join(self._preview_lines(code_files))
+    
+    def _preview_lines(self, code_files):
+        """
+        Generate the lines of the preview text one by one.
         
-        for header in file_headers:
-            # Extract file path
-            file_path = header.get_text().strip()
-            if file_path.endswith(':'):
-                file_path = file_path[:-1]
+        Args:
+            code_files (list): [file path, line count] for each file path header
             
-            # Find the next table with code
-            table = header.find_next('table', class_='syntax-highlight')
-            if table:
-                # Count lines of code
-                added_lines = table.find_all('tr', class_='line added')
-                line_count = len(added_lines)
-                preview_lines.append(f"{file_path} ({line_count} lines)")
-            else:
-                preview_lines.append(f"{file_path} (0 lines)")
+        Yields:
+            str: Preview line
+        """
+        if not code_files:
+            yield "No code files found in HTML."
+            return
         
-        return "\n".join(preview_lines)
+        yield "Files that will be extracted:"
+        yield ""
+        for file_path, line_count in code_files:
+            yield f"{file_path} ({line_count} lines)"
 
 class HTMLCodeSaverApp:
     """GUI application for the HTML Code Saver."""
@@ -177,6 +481,13 @@ class HTMLCodeSaverApp:
         # Create the HTML Code Saver
         self.saver = HTMLCodeSaver()
         
+        # Incremented for every preview request
+        self._preview_generation = 0
+        
+        # (handler, args) pairs from worker threads, run on the UI thread by poll_results
+        self.result_queue = queue.Queue()
+        self.root.after(RESULT_POLL_MS, self.poll_results)
+        
         # Set up the main frame
         main_frame = ttk.Frame(root, padding="10")
         main_frame.pack(fill=tk.BOTH, expand=True)
@@ -262,36 +573,80 @@ class HTMLCodeSaverApp:
         
         # Update status
         self.status_var.set("Generating preview...")
-        self.root.update()
+        self.root.update_idletasks()
         
+        # Previews still being parsed or shown for an earlier request are dropped
+        self._preview_generation += 1
+        generation = self._preview_generation
+        
+        # Parse in the background so the window keeps repainting
+        threading.Thread(target=self._preview_worker, args=(generation, html_file), daemon=True).start()
+    
+    def _preview_worker(self, generation, html_file):
+        """
+        Read and parse the HTML file off the UI thread.
+        
+        Args:
+            generation (int): Preview request this runs for
+            html_file (str): Path to the HTML file
+        """
         try:
-            # Read HTML file
-            with open(html_file, 'r', encoding='utf-8') as file:
-                html_content = file.read()
-        except UnicodeDecodeError:
-            # Try with different encoding if utf-8 fails
-            try:
-                with open(html_file, 'r', encoding='latin-1') as file:
-                    html_content = file.read()
-            except Exception as e:
-                self.status_var.set("Error reading file")
-                messagebox.showerror("Error", f"Error reading HTML file: {str(e)}")
-                return
+            # Read and parse HTML file; Save Archive reuses the result
+            preview_lines = self.saver.preview_html_file(html_file)
         except Exception as e:
-            self.status_var.set("Error reading file")
-            messagebox.showerror("Error", f"Error reading HTML file: {str(e)}")
+            self.result_queue.put((self.preview_error, (generation, str(e))))
             return
         
-        # Generate preview
-        preview = self.saver._generate_preview(html_content)
+        self.result_queue.put((self.render_preview, (generation, preview_lines, 0)))
+    
+    def poll_results(self):
+        """Run the handlers queued by worker threads; runs on the UI thread."""
+        while True:
+            try:
+                handler, args = self.result_queue.get_nowait()
+            except queue.Empty:
+                break
+            handler(*args)
+        
+        self.root.after(RESULT_POLL_MS, self.poll_results)
+    
+    def render_preview(self, generation, preview_lines, start):
+        """
+        Add a batch of preview lines to the preview box, scheduling the next batch when idle.
+        
+        Runs on the UI thread.
+        
+        Args:
+            generation (int): Preview request the lines were generated for
+            preview_lines (list): Preview lines to show
+            start (int): Index of the first line in this batch
+        """
+        if generation != self._preview_generation:
+            return
+        
+        end = start + PREVIEW_BATCH_SIZE
+        text = "\n".join(preview_lines[start:end])
         
-        # Update preview text
         self.preview_text.config(state=tk.NORMAL)
-        self.preview_text.delete(1.0, tk.END)
-        self.preview_text.insert(tk.END, preview)
+        if start == 0:
+            self.preview_text.delete(1.0, tk.END)
+        else:
+            text = "\n" + text
+        self.preview_text.insert(tk.END, text)
         self.preview_text.config(state=tk.DISABLED)
         
-        self.status_var.set("Preview generated")
+        if end < len(preview_lines):
+            self.root.after_idle(self.render_preview, generation, preview_lines, end)
+        else:
+            self.status_var.set("Preview generated")
+    
+    def preview_error(self, generation, error_message):
+        """Report a failure to read the HTML file; runs on the UI thread."""
+        if generation != self._preview_generation:
+            return
+        
+        self.status_var.set("Error reading file")
+        messagebox.showerror("Error", f"Error reading HTML file: {error_message}")
     
     def save_archive(self):
         """Save the HTML file as an archive."""
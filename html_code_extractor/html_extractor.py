@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 import os
 import re
-import argparse
-from bs4 import BeautifulSoup
-from pathlib import Path
+import mmap
+import codecs
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from lxml import etree
 import logging
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
@@ -15,114 +18,551 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def extract_code_from_html(html_file_path, output_dir=None):
+# Classes identifying file path headers, code tables and added code lines.
+# Like CSS class selectors, an element matches when it has all of the classes.
+FILE_PATH_CLASS = "text-sm text-zinc-400 mb-2 font-mono"
+CODE_TABLE_CLASS = "syntax-highlight"
+CODE_LINE_CLASS = "line added"
+
+@functools.lru_cache(maxsize=32)
+def _compile_selectors(file_path_class, code_table_class, code_line_class):
     """
-    Extract code blocks from HTML file and create corresponding files.
+    Compile the header, table and line classes into the class sets matched while parsing.
     
     Args:
-        html_file_path (str): Path to the HTML file
-        output_dir (str, optional): Directory to save extracted files. Defaults to current directory.
+        file_path_class (str): Classes of file path headers
+        code_table_class (str): Classes of code tables
+        code_line_class (str): Classes of added code lines
     
     Returns:
-        list: List of created file paths
+        tuple: (header classes, table classes, code line classes), each a frozenset
     """
-    # Set default output directory if not provided
-    if output_dir is None:
-        output_dir = os.getcwd()
+    return (
+        frozenset(file_path_class.split()),
+        frozenset(code_table_class.split()),
+        frozenset(code_line_class.split()),
+    )
+
+# Matchers for the default classes are built once at import
+DEFAULT_MATCHERS = _compile_selectors(FILE_PATH_CLASS, CODE_TABLE_CLASS, CODE_LINE_CLASS)
+
+def _selector_matchers(selectors):
+    """
+    Get the compiled matchers for a selectors mapping.
     
-    # Create output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
+    Args:
+        selectors (dict): Optional "file_path_class", "code_table_class" and "code_line_class"
+            overrides, as stored in archive metadata
+    
+    Returns:
+        tuple: Matchers as returned by _compile_selectors
+    """
+    if not selectors:
+        return DEFAULT_MATCHERS
+    
+    # Missing or empty classes keep their defaults; equal selectors share cached matchers
+    return _compile_selectors(
+        selectors.get("file_path_class") or FILE_PATH_CLASS,
+        selectors.get("code_table_class") or CODE_TABLE_CLASS,
+        selectors.get("code_line_class") or CODE_LINE_CLASS,
+    )
+
+# Leading line number in rows without spans
+LINE_NUMBER_RE = re.compile(r'^\d+\s*')
+
+# Text inside these elements is not part of an element's visible text
+HIDDEN_TEXT_TAGS = frozenset(('script', 'style', 'template'))
+
+# Encoding declarations are looked for in this many leading bytes
+ENCODING_SNIFF_SIZE = 4096
+BYTE_ORDER_MARKS = (
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+
+# HTML files larger than this are memory-mapped before parsing
+HTML_MMAP_THRESHOLD = 4 * 1024 * 1024
+
+# Number of parsed HTML files kept in memory
+PARSE_CACHE_SIZE = 8
+
+# Bytes fed to the parser at a time
+PARSE_CHUNK_SIZE = 64 * 1024
+
+# Pull parsers reused across calls, one per encoding and thread
+_parsers = threading.local()
+
+# Threads used to write extracted files; file writes release the GIL
+WRITE_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+def _get_parser(encoding):
+    """
+    Get this thread's reusable pull parser for an encoding.
+    
+    Args:
+        encoding (str): Encoding used to decode documents
+    
+    Returns:
+        etree.HTMLPullParser: Parser reporting start and end events
+    """
+    parsers = getattr(_parsers, 'by_encoding', None)
+    if parsers is None:
+        parsers = _parsers.by_encoding = {}
+    
+    parser = parsers.get(encoding)
+    if parser is None:
+        # huge_tree lifts libxml2's size limits for very large archives
+        parser = etree.HTMLPullParser(events=('start', 'end'), encoding=encoding, huge_tree=True)
+        parsers[encoding] = parser
+    return parser
+
+def _read_events(parser, source):
+    """
+    Feed a file to a pull parser chunk by chunk and yield its parse events.
+    
+    The parser is reset even if parsing fails or stops early, so it can be reused.
+    
+    Args:
+        parser (etree.HTMLPullParser): Parser returned by _get_parser
+        source: Binary file-like object
     
-    # Read HTML file
+    Yields:
+        tuple: (event, element)
+    """
+    closed = False
     try:
-        with open(html_file_path, 'r', encoding='utf-8') as file:
-            html_content = file.read()
-    except UnicodeDecodeError:
-        # Try with different encoding if utf-8 fails
-        try:
-            with open(html_file_path, 'r', encoding='latin-1') as file:
-                html_content = file.read()
-            logger.warning(f"Fallback to latin-1 encoding for {html_file_path}")
-        except Exception as e:
-            logger.error(f"Error reading HTML file: {e}")
-            return []
-    except Exception as e:
-        logger.error(f"Error reading HTML file: {e}")
-        return []
+        while True:
+            chunk = source.read(PARSE_CHUNK_SIZE)
+            if not chunk:
+                break
+            parser.feed(chunk)
+            yield from parser.read_events()
+        
+        closed = True
+        parser.close()
+        yield from parser.read_events()
+    finally:
+        if not closed:
+            try:
+                parser.close()
+            except etree.LxmlError:
+                pass
+        # Drop events left over from an interrupted document
+        for _ in parser.read_events():
+            pass
+
+def sniff_encoding(html_data):
+    """
+    Detect the encoding declared by a byte order mark or <meta> charset.
     
-    # Parse HTML
-    soup = BeautifulSoup(html_content, 'html.parser')
+    Only the first few kilobytes of the data are looked at.
     
-    # Find all code blocks
-    code_blocks = {}
-    current_file = None
+    Args:
+        html_data (bytes): Raw HTML, or at least its first ENCODING_SNIFF_SIZE bytes
     
-    # Find all elements with class "text-sm text-zinc-400 mb-2 font-mono"
-    # These contain the file paths
-    file_headers = soup.find_all(class_=re.compile(r"text-sm text-zinc-400 mb-2 font-mono"))
+    Returns:
+        str: Encoding name understood by lxml, or None if nothing usable is declared
+    """
+    head = html_data[:ENCODING_SNIFF_SIZE]
+    for bom, encoding in BYTE_ORDER_MARKS:
+        if head.startswith(bom):
+            return encoding
     
-    if not file_headers:
-        logger.warning("No file headers found. Check if the HTML structure matches the expected pattern.")
+    match = META_CHARSET_RE.search(head)
+    if not match:
+        return None
+    
+    try:
+        encoding = codecs.lookup(match.group(1).decode('ascii')).name
+        # libxml2 does not know every Python codec; the parser is kept for this thread's parses
+        _get_parser(encoding)
+    except LookupError:
+        return None
+    return encoding
+
+def _sniff_encoding(html_file_path):
+    """
+    Detect the encoding declared at the start of an HTML file.
+    
+    Args:
+        html_file_path (str): Path to the HTML file
+    
+    Returns:
+        str: Encoding name understood by lxml, or None if nothing usable is declared
+    """
+    with open(html_file_path, 'rb') as file:
+        return sniff_encoding(file.read(ENCODING_SNIFF_SIZE))
+
+def _classify_element(element, header_classes, table_classes):
+    """
+    Check whether an element is a file path header or a code table.
+    
+    Args:
+        element: lxml element
+        header_classes (frozenset): Classes a file path header must have
+        table_classes (frozenset): Classes a code table must have
+    
+    Returns:
+        str: "header", "table" or None
+    """
+    classes = element.get('class')
+    if not classes:
+        return None
+    
+    classes = classes.split()
+    if header_classes.issubset(classes):
+        return "header"
+    if element.tag == 'table' and table_classes.issubset(classes):
+        return "table"
+    return None
+
+def _element_text(element):
+    """
+    Get the visible text of an element and its descendants.
+    
+    Comments and the content of script, style and template elements are left out.
+    Elements without such descendants, which is nearly all of them, are serialized
+    by libxml2 in one call.
+    
+    Args:
+        element: lxml element
+    
+    Returns:
+        str: Text content without the element's tail
+    """
+    if next(element.iterdescendants(*HIDDEN_TEXT_TAGS), None) is None:
+        return etree.tostring(element, method='text', encoding='unicode', with_tail=False)
+    
+    text_parts = []
+    _append_visible_text(element, text_parts)
+    return ''.join(text_parts)
+
+def _append_visible_text(element, text_parts):
+    """
+    Append the visible text of an element and its descendants, without its tail.
+    
+    Args:
+        element: lxml element
+        text_parts (list): List the text pieces are appended to
+    """
+    if element.text:
+        text_parts.append(element.text)
+    for child in element:
+        # Comments and processing instructions have no string tag
+        if isinstance(child.tag, str) and child.tag not in HIDDEN_TEXT_TAGS:
+            _append_visible_text(child, text_parts)
+        if child.tail:
+            text_parts.append(child.tail)
+
+def _extract_code_line(line):
+    """
+    Extract the code from a table row, removing the line number.
+    
+    Args:
+        line: lxml tr element
+    
+    Returns:
+        str: Code text
+    """
+    code_spans = list(line.iter('span'))
+    if code_spans:
+        # Skip the first span which contains the line number
+        return ''.join([_element_text(span) for span in code_spans[1:]])
+    
+    # Fallback to get all text if no spans found
+    code_text = _element_text(line).strip()
+    # Try to remove line numbers using regex
+    return LINE_NUMBER_RE.sub('', code_text)
+
+def _extract_code(table, line_classes):
+    """
+    Extract the added code lines from a code table as a single text.
+    
+    Args:
+        table: lxml table element
+        line_classes (frozenset): Classes an added code line must have
+    
+    Returns:
+        str: Code lines joined with newlines, or None if the table has no added lines
+    """
+    # A subset test per row is cheaper than an XPath doing string matching in libxml2
+    lines = [line for line in table.iter('tr') if line_classes.issubset((line.get('class') or '').split())]
+    if not lines:
+        return None
+    return '\n'.join(map(_extract_code_line, lines))
+
+def _stream_code_blocks(html_file_path, encoding, matchers):
+    """
+    Stream the HTML file through lxml and collect the code for each file header.
     
-    for header in file_headers:
-        # Extract file path from the header text
-        file_path = header.get_text().strip()
+    Large files are memory-mapped and read by the parser straight from the
+    page cache; smaller ones are read in chunks.
+    
+    Args:
+        html_file_path (str): Path to the HTML file
+        encoding (str): Encoding used to decode the file
+        matchers (tuple): Matchers as returned by _compile_selectors
+    
+    Returns:
+        tuple: (code by file path, number of headers found, parser error log)
+    """
+    with open(html_file_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size <= HTML_MMAP_THRESHOLD:
+            return _parse_code_blocks(file, encoding, matchers)
         
-        # Clean up the file path
-        if file_path.endswith(':'):
-            file_path = file_path[:-1]  # Remove trailing colon
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as source:
+            if hasattr(source, 'madvise'):
+                source.madvise(mmap.MADV_SEQUENTIAL)
+            return _parse_code_blocks(source, encoding, matchers)
+
+def _parse_code_blocks(source, encoding, matchers):
+    """
+    Parse HTML incrementally and collect the code for each file header.
+    
+    Elements are cleared as soon as they have been consumed, so only the part
+    of the document that is still open is kept in memory.
+    
+    Args:
+        source: Binary file-like object
+        encoding (str): Encoding used to decode the file
+        matchers (tuple): Matchers as returned by _compile_selectors
+    
+    Returns:
+        tuple: (code by file path, number of headers found, parser error log)
+    """
+    header_classes, table_classes, line_classes = matchers
+    # [file path, code] for every header, in the order the headers end
+    headers = []
+    # Headers still waiting for the next code table, claimed when the table starts
+    pending_headers = []
+    # Entries of the open headers, and the headers claimed by each open code table, innermost last
+    open_headers = []
+    open_tables = []
+    headers_found = 0
+    # Number of open headers/tables whose content is still needed
+    capture_depth = 0
+    
+    parser = _get_parser(encoding)
+    for event, element in _read_events(parser, source):
+        kind = _classify_element(element, header_classes, table_classes)
         
-        # Skip empty file paths
-        if not file_path:
+        if event == 'start':
+            if kind == "header":
+                capture_depth += 1
+                # The header waits for the first code table starting after it, even inside it
+                header = [None, None]
+                open_headers.append(header)
+                pending_headers.append(header)
+            elif kind == "table":
+                capture_depth += 1
+                # The table belongs to every header started since the previous one, as with
+                # find_next('table'): a table nested in a claimed table only gets headers started
+                # inside the outer one, and the outer table keeps the nested rows
+                open_tables.append(pending_headers)
+                pending_headers = []
             continue
         
-        current_file = file_path
-        code_blocks[current_file] = []
-        
-        # Find the next table with class "syntax-highlight"
-        table = header.find_next('table', class_='syntax-highlight')
-        if table:
-            # Find all rows with class "line added"
-            added_lines = table.find_all('tr', class_='line added')
+        if kind == "header":
+            capture_depth -= 1
+            headers_found += 1
             
-            for line in added_lines:
-                # Extract code from the line, removing line numbers
-                code_spans = line.find_all('span')
-                if code_spans:
-                    # Skip the first span which contains the line number
-                    code_text = ''.join(span.get_text() for span in code_spans[1:])
-                else:
-                    # Fallback to get all text if no spans found
-                    code_text = line.get_text().strip()
-                    # Try to remove line numbers using regex
-                    code_text = re.sub(r'^\d+\s*', '', code_text)
-                
-                code_blocks[current_file].append(code_text)
-    
-    # Create files with extracted code
-    files_created = []
-    for file_path, code_lines in code_blocks.items():
-        if not code_lines:
-            continue
-        
-        # Create full path
-        full_path = os.path.join(output_dir, file_path)
+            # Extract file path from the header text
+            file_path = _element_text(element).strip()
+            
+            # Clean up the file path (remove trailing colon)
+            if file_path[-1:] == ':':
+                file_path = file_path[:-1]
+            
+            header = open_headers.pop()
+            header[0] = file_path
+            headers.append(header)
+        elif kind == "table":
+            capture_depth -= 1
+            
+            claimed = open_tables.pop()
+            if claimed:
+                code = _extract_code(element, line_classes)
+                for header in claimed:
+                    header[1] = code
         
+        # Drop consumed elements unless an enclosing header/table still needs them
+        if capture_depth == 0:
+            element.clear(keep_tail=True)
+            # Content after </html> can produce a second root element without a parent
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+    
+    # Later headers with the same path replace the code of earlier ones; empty paths are skipped
+    code_blocks = {}
+    for file_path, code in headers:
+        if file_path:
+            code_blocks[file_path] = code
+    
+    return code_blocks, headers_found, parser.feed_error_log.copy()
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_cached(html_file_path, mtime_ns, size, matchers):
+    """
+    Parse an HTML file and collect its code blocks, once per version of the file.
+    
+    The modification time and size are part of the cache key, so an edited
+    file is parsed again. Errors are raised and therefore never cached.
+    
+    Args:
+        html_file_path (str): Absolute path to the HTML file
+        mtime_ns (int): Modification time of the file in nanoseconds
+        size (int): Size of the file in bytes
+        matchers (tuple): Matchers as returned by _compile_selectors
+    
+    Returns:
+        tuple: (code by file path, number of headers found)
+    """
+    # Stream the HTML file off disk instead of reading it into memory
+    encoding = _sniff_encoding(html_file_path)
+    code_blocks, headers_found, error_log = _stream_code_blocks(html_file_path, encoding or 'utf-8', matchers)
+    
+    # Files without a declared encoding fall back to latin-1 if they are not utf-8
+    if encoding is None and any(error.type_name == 'ERR_INVALID_ENCODING' for error in error_log):
+        code_blocks, headers_found, error_log = _stream_code_blocks(html_file_path, 'iso-8859-1', matchers)
+        logger.warning(f"Fallback to latin-1 encoding for {html_file_path}")
+    
+    return code_blocks, headers_found
+
+def collect_code_blocks(html_file_path, selectors=None):
+    """
+    Collect code blocks from HTML file without creating any files.
+    
+    Recently parsed files are served from memory until they change on disk.
+    
+    Args:
+        html_file_path (str): Path to the HTML file
+        selectors (dict, optional): Class overrides, as stored in archive metadata. Defaults to the module classes.
+    
+    Returns:
+        dict: Code keyed by file path (None when no code was found), or None if the file could not be read
+    """
+    matchers = _selector_matchers(selectors)
+    
+    try:
+        stat = os.stat(html_file_path)
+        code_blocks, headers_found = _parse_cached(
+            os.path.abspath(html_file_path), stat.st_mtime_ns, stat.st_size, matchers
+        )
+    except Exception as e:
+        logger.error(f"Error reading HTML file: {e}")
+        return None
+    
+    if not headers_found:
+        logger.warning("No file headers found. Check if the HTML structure matches the expected pattern.")
+    
+    # Copy so callers cannot change the cached result
+    return dict(code_blocks)
+
+def _write_file(path, text):
+    """
+    Write text to a file with a single unbuffered write on a raw file descriptor.
+    
+    Newlines are translated to os.linesep like a text-mode file would do.
+    
+    Args:
+        path (str): Path of the file to create or overwrite
+        text (str): Text to write
+    """
+    if os.linesep != '\n':
+        text = text.replace('\n', os.linesep)
+    data = memoryview(text.encode('utf-8'))
+    
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0) | getattr(os, 'O_CLOEXEC', 0)
+    fd = os.open(path, flags, 0o666)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+def write_code_blocks(code_blocks, output_dir, progress_callback=None):
+    """
+    Create files for collected code blocks.
+    
+    Args:
+        code_blocks (dict): Code keyed by file path, as returned by collect_code_blocks
+        output_dir (str): Directory to save extracted files
+        progress_callback (callable, optional): Called with the percentage of files written
+    
+    Returns:
+        list: List of created file paths
+    """
+    blocks = [(file_path, os.path.join(output_dir, file_path), code)
+              for file_path, code in code_blocks.items() if code is not None]
+    
+    # Create each directory once, parents first
+    directories = {os.path.dirname(full_path) for _, full_path, _ in blocks}
+    for directory in sorted(directories, key=len):
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except Exception as e:
+            logger.error(f"Error creating directory {directory}: {e}")
+    
+    def write_one(block):
+        _, full_path, code = block
         try:
-            # Create directory structure
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            
             # Write code to file
-            with open(full_path, 'w', encoding='utf-8') as file:
-                file.write('\n'.join(code_lines))
-            
-            files_created.append(file_path)
-            logger.info(f"Created file: {file_path}")
+            _write_file(full_path, code)
         except Exception as e:
-            logger.error(f"Error creating file {file_path}: {e}")
+            return e
+        return None
+    
+    # Write files concurrently, logging from this thread in the original order
+    files_created = []
+    # Individual files are only logged at debug level; one summary line is logged at info level
+    log_files = logger.isEnabledFor(logging.DEBUG)
+    with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as executor:
+        results = zip(blocks, executor.map(write_one, blocks))
+        for i, ((file_path, _, _), error) in enumerate(results, 1):
+            if error:
+                logger.error(f"Error creating file {file_path}: {error}")
+            else:
+                files_created.append(file_path)
+                if log_files:
+                    logger.debug(f"Created file: {file_path}")
+            
+            if progress_callback:
+                progress_callback(i / len(blocks) * 100)
+    
+    logger.info(f"Created {len(files_created)} files in {output_dir}")
     
     return files_created
 
+def extract_code_from_html(html_file_path, output_dir=None, progress_callback=None):
+    """
+    Extract code blocks from HTML file and create corresponding files.
+    
+    Args:
+        html_file_path (str): Path to the HTML file
+        output_dir (str, optional): Directory to save extracted files. Defaults to current directory.
+        progress_callback (callable, optional): Called with the percentage of files written
+    
+    Returns:
+        list: List of created file paths
+    """
+    # Set default output directory if not provided
+    if output_dir is None:
+        output_dir = os.getcwd()
+    
+    # Create output directory if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
+    
+    code_blocks = collect_code_blocks(html_file_path)
+    if not code_blocks:
+        return []
+    
+    # Create files with extracted code
+    return write_code_blocks(code_blocks, output_dir, progress_callback)
+
 class HTMLExtractorApp:
     def __init__(self, root):
         self.root = root
@@ -2,14 +2,31 @@
 import os
 import re
 import sys
+import html
 import json
+import bisect
+import mmap
+import codecs
+import functools
+import collections
 import logging
+import queue
 import tkinter as tk
 import threading
-import configparser
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import filedialog, ttk, messagebox, scrolledtext
-from bs4 import BeautifulSoup
-from pathlib import Path
+from bs4 import UnicodeDammit
+from lxml import etree
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    # selectolax is optional; lxml is used without it
+    LexborHTMLParser = None
+try:
+    import orjson
+except ImportError:
+    # orjson is optional; the json module parses the settings without it
+    orjson = None
 
 logging.basicConfig(
     level=logging.INFO,
@@ -27,22 +44,102 @@ DEFAULT_CONFIG = {
         "default_dir": os.path.join(os.path.expanduser("~"), "Desktop", "WEB-CODES"),
         "encoding": "utf-8"
     },
+    "parsing": {
+        "fast_mode": False
+    },
     "ui": {
         "theme": "default",
         "window_size": "800x600"
     }
 }
 
+# Threads used to write extracted files
+WRITE_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Extra flags for output files: binary mode on Windows, not inherited by child processes
+WRITE_FLAGS = getattr(os, 'O_BINARY', 0) | getattr(os, 'O_CLOEXEC', 0)
+
+# Milliseconds between progress bar updates during extraction
+PROGRESS_POLL_MS = 50
+
+# Milliseconds between checks for results handed back by worker threads
+RESULT_POLL_MS = 50
+
+# Number of recently collected documents kept, so preview and extract runs on an unchanged file reuse the parse
+PARSE_CACHE_SIZE = 8
+_parse_cache = collections.OrderedDict()
+_parse_cache_lock = threading.Lock()
+
+# Files larger than this are decoded from a memory map instead of being read into memory first
+HTML_MMAP_THRESHOLD = 4 * 1024 * 1024
+
+# Byte order marks that override the chosen encoding
+BYTE_ORDER_MARKS = (codecs.BOM_UTF8, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE, codecs.BOM_UTF32_BE)
+
+# Characters of decoded HTML fed to the lxml parser at a time
+FEED_CHUNK_SIZE = 64 * 1024
+
+# Code lines shorter than this are interned, so lines repeated across files (blank lines, braces,
+# imports, ...) share one string in the parse cache; longer lines rarely repeat
+INTERN_LINE_LENGTH = 128
+
+# Elements whose text is not part of the page text, as in BeautifulSoup's get_text
+HIDDEN_TEXT_TAGS = frozenset(('script', 'style', 'template'))
+
+# Leading line number in rows without spans
+LINE_NUMBER_RE = re.compile(r'^\d+\s*')
+
+# Characters that must be escaped in CSS class selectors
+CSS_SPECIAL_RE = re.compile(r'([^\w-])')
+
+# Fast mode: comments, scripts and styles, whose text never reaches the extracted code
+HIDDEN_MARKUP_RE = re.compile(r'<(?:!--.*?-->|(script|style)(?=[\s/>])[^>]*>.*?</\1\s*>)', re.DOTALL)
+
+# Fast mode: attributes the patterns would misread, which need a parser anywhere: class attributes
+# that are not double-quoted, not spelled in lowercase, hold entities or are repeated in one tag
+# (parsers use the first), and quoted attribute values holding '<', '>' or a class attribute
+UNQUOTED_CLASS_RE = re.compile(r'class\s*=\s*(?!["\s])')
+CLASS_CASE_RE = re.compile(r'(?:C[Ll][Aa][Ss][Ss]|c(?:L[Aa][Ss][Ss]|l(?:A[Ss][Ss]|a(?:S[Ss]|sS))))\s*=')
+CLASS_ENTITY_RE = re.compile(r'class\s*=\s*"[^"]*&')
+DUPLICATE_CLASS_RE = re.compile(r'class\s*=\s*"[^"]*"[^<>]*\sclass\s*=')
+QUOTED_VALUE_RE = re.compile(r'''=\s*(?:"[^"<>]*|'[^'<>]*)(?:[<>]|\sclass\s*=)''')
+
+# Fast mode: tag names that are not all lowercase and unclosed comments, scripts and styles
+# (group 1), which need a parser anywhere, and markup that needs one inside headers and code tables
+TAG_CHECK_RE = re.compile(
+    r'<(?:(/?[a-z\d_-]*[A-Z]|!--|(?:script|style)(?=[\s/>]))|[!?]'
+    r'|(?:t(?:emplate|extarea|itle)|xmp|iframe|no(?:script|embed|frames)|plaintext|select)(?=[\s/>]))')
+
+# Fast mode: tags, class attributes, table and row boundaries, and spans holding only text
+TAG_RE = re.compile(r'</?[a-zA-Z][^>]*>')
+START_TAG_RE = re.compile(r'<([a-zA-Z][\w-]*)(?=[\s/>])[^>]*>')
+CLASS_ATTR_RE = re.compile(r'\sclass\s*=\s*"([^"]*)"')
+TABLE_END_RE = re.compile(r'</table\s*>')
+ROW_TABLE_TAG_RE = re.compile(r'<(/?)(t(?:[dhr]|body|head|foot)|caption|colgroup|col)(?=[\s/>])')
+ROW_END_RE = re.compile(r'</tr\s*>')
+SPAN_TAG_RE = re.compile(r'<(/?)span(?=[\s/>])[^>]*>')
+INNER_TAG_RE = re.compile(r'</?([a-zA-Z][\w-]*)')
+TEXT_SPAN_RE = re.compile(r'<span(?=[\s/>])[^>]*>([^<]*)</span\s*>')
+
+# Fast mode: tags allowed inside a header; any other tag may close the header early (a block
+# inside a <p>) and needs a parser
+HEADER_INNER_TAGS = frozenset([
+    'a', 'abbr', 'b', 'bdi', 'bdo', 'br', 'cite', 'code', 'em', 'font', 'i', 'kbd', 'mark', 'q',
+    's', 'samp', 'small', 'span', 'strong', 'sub', 'sup', 'time', 'tt', 'u', 'var', 'wbr'])
+
 def load_config(config_path=None):
     if not config_path:
         config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
         
     if os.path.exists(config_path):
         try:
-            with open(config_path, 'r') as f:
-                config = json.load(f)
-                logger.info(f"Loaded configuration from {config_path}")
-                return config
+            # The app cannot be laid out without its settings, so they are read up front;
+            # parsing the raw bytes lets orjson skip the text decoding layer
+            with open(config_path, 'rb') as f:
+                data = f.read()
+            config = orjson.loads(data) if orjson is not None else json.loads(data)
+            logger.info(f"Loaded configuration from {config_path}")
+            return config
         except Exception as e:
             logger.error(f"Error loading configuration: {e}")
     
@@ -69,148 +166,677 @@ def save_config(config, config_path=None):
     except Exception as e:
         logger.error(f"Error saving configuration: {e}")
 
-def extract_code_from_html(html_file_path, output_dir, selectors, encoding="utf-8", progress_callback=None):
-    os.makedirs(output_dir, exist_ok=True)
-    
+def read_html(html_file_path, encoding="utf-8"):
     try:
-        with open(html_file_path, 'r', encoding=encoding) as file:
-            html_content = file.read()
-    except UnicodeDecodeError:
-        try:
-            with open(html_file_path, 'r', encoding='latin-1') as file:
+        with open(html_file_path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size <= HTML_MMAP_THRESHOLD:
                 html_content = file.read()
-            logger.warning(f"Fallback to latin-1 encoding for {html_file_path}")
-        except Exception as e:
-            logger.error(f"Error reading HTML file: {e}")
-            return []
+            else:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                    # Decode large pages straight from the map when the chosen encoding fits
+                    if not source[:4].startswith(BYTE_ORDER_MARKS):
+                        try:
+                            return str(source, encoding)
+                        except (UnicodeDecodeError, LookupError):
+                            pass
+                    html_content = source[:]
     except Exception as e:
         logger.error(f"Error reading HTML file: {e}")
-        return []
+        return None
+    
+    # Try the chosen encoding first, then the document's own declaration or a detected one
+    # (charset-normalizer/cchardet are used by bs4 when installed)
+    dammit = UnicodeDammit(html_content, [encoding], is_html=True)
+    if dammit.unicode_markup is None:
+        logger.error(f"Error reading HTML file: could not decode {html_file_path}")
+        return None
     
-    soup = BeautifulSoup(html_content, 'html.parser')
+    if dammit.original_encoding and dammit.original_encoding.lower() != encoding.lower():
+        logger.warning(f"Fallback to {dammit.original_encoding} encoding for {html_file_path}")
+    
+    return dammit.unicode_markup
+
+def _clean_file_path(text):
+    file_path = text.strip()
+    
+    # Slice comparison avoids a method call per header
+    return file_path[:-1] if file_path[-1:] == ':' else file_path
+
+def _css_class_selector(tag, class_names):
+    # Matches elements having all of the classes, escaping characters like ':' in "md:flex"
+    return tag + "".join("." + CSS_SPECIAL_RE.sub(r'\\\1', name) for name in class_names.split())
+
+@functools.lru_cache(maxsize=32)
+def _compile_selectors(file_path_class, code_table_class, code_line_class):
+    # Class sets for the lxml path and CSS queries for selectolax, built once per selector settings
+    header_classes = frozenset(file_path_class.split())
+    table_classes = frozenset(code_table_class.split())
+    line_classes = frozenset(code_line_class.split())
+    
+    header_selector = _css_class_selector("", file_path_class)
+    table_selector = _css_class_selector("table", code_table_class)
+    headers_and_tables = f"{header_selector}, {table_selector}" if header_classes else None
+    line_selector = _css_class_selector("tr", code_line_class)
+    
+    return header_classes, table_classes, line_classes, headers_and_tables, line_selector
+
+def _selector_matchers(selectors):
+    return _compile_selectors(selectors["file_path_class"], selectors["code_table_class"], selectors["code_line_class"])
+
+def _pair_code_blocks(nodes, is_header, header_text, table_code_lines, progress_callback):
+    # Headers and code tables are in document order; a header's code is the next table after it,
+    # so consecutive headers share a table and headers without a later table get no code
+    total_headers = sum(is_header)
     
     code_blocks = {}
-    current_file = None
+    pending_files = []
+    headers_seen = 0
     
-    file_path_class = selectors["file_path_class"]
-    code_table_class = selectors["code_table_class"]
-    code_line_class = selectors["code_line_class"]
+    for node, header in zip(nodes, is_header):
+        if header:
+            if progress_callback:
+                progress_callback(headers_seen / total_headers * 100)
+            headers_seen += 1
+            
+            file_path = _clean_file_path(header_text(node))
+            if file_path:
+                code_blocks[file_path] = []
+                pending_files.append(file_path)
+        elif pending_files:
+            # The first header takes the fresh list; only headers sharing the table need copies
+            code_lines = table_code_lines(node)
+            for file_path in pending_files[1:]:
+                code_blocks[file_path] = list(code_lines)
+            code_blocks[pending_files[0]] = code_lines
+            pending_files = []
     
-    file_headers = soup.find_all(class_=re.compile(file_path_class))
+    return code_blocks, total_headers
+
+def _selectolax_code_line(line):
+    # Full text of the line and its code without the line number; traversing the row in lexbor
+    # is cheaper than compiling a CSS query for every line
+    text = line.text().strip()
+    code_spans = [node for node in line.traverse() if node.tag == 'span']
+    if code_spans:
+        # Skip the first span which contains the line number
+        return text, ''.join([span.text() for span in code_spans[1:]])
     
-    if not file_headers:
-        logger.warning("No file headers found. Check if the HTML structure matches the expected pattern.")
+    # Fallback to get all text if no spans found
+    return text, LINE_NUMBER_RE.sub('', text)
+
+def _selectolax_code_lines(html_content, matchers, progress_callback):
+    header_classes, _, _, headers_and_tables, line_selector = matchers
+    if not header_classes:
+        return {}, 0
     
-    total_headers = len(file_headers)
+    def table_code_lines(table):
+        return [_selectolax_code_line(line) for line in table.css(line_selector)]
     
-    for i, header in enumerate(file_headers):
-        if progress_callback:
-            progress_callback(i / total_headers * 100)
+    tree = LexborHTMLParser(html_content)
+    # Script, style and template text is not page text, as in the lxml collector
+    tree.strip_tags(list(HIDDEN_TEXT_TAGS))
+    
+    # One CSS query returns headers and code tables together, in document order
+    nodes = tree.css(headers_and_tables)
+    is_header = [header_classes.issubset((node.attributes.get('class') or '').split()) for node in nodes]
+    
+    return _pair_code_blocks(nodes, is_header, lambda node: node.text(), table_code_lines, progress_callback)
+
+class _CodeLineCollector:
+    # lxml parser target that keeps only header text and code rows instead of building a tree.
+    # It sees the same parse events BeautifulSoup's lxml builder would turn into a tree.
+    
+    def __init__(self, matchers):
+        self.header_classes, self.table_classes, self.line_classes, _, _ = matchers
+        # A header's class attribute must contain its longest class name, so most elements
+        # can be ruled out with a substring test instead of splitting their classes
+        self.header_marker = max(self.header_classes, key=len)
         
-        file_path = header.get_text().strip()
+        # [text parts, (text, code) lines] for every header, in document order
+        self.headers = []
+        # Headers still waiting for the next code table
+        self.pending = []
+        # (header, table, row, is_span, is_hidden) opened by each element that has not ended yet
+        self.stack = []
+        # Number of open elements whose text BeautifulSoup's get_text would leave out
+        self.hidden_depth = 0
         
-        if file_path.endswith(':'):
-            file_path = file_path[:-1]  
+        self.open_headers = []
+        # Open tables as [claimed headers, (text, code) lines]
+        self.open_tables = []
+        # Open rows as [text parts, text parts per span, indexes of open spans, (table lines, index) slots]
+        self.open_rows = []
+    
+    def start(self, tag, attrib):
+        class_attr = attrib.get('class')
+        header = table = row = None
+        is_span = False
+        is_hidden = tag in HIDDEN_TEXT_TAGS
+        if is_hidden:
+            self.hidden_depth += 1
         
-        if not file_path:
-            continue
+        if class_attr and (tag == 'table' or tag == 'tr' or self.header_marker in class_attr):
+            classes = class_attr.split()
+        else:
+            classes = ()
         
-        current_file = file_path
-        code_blocks[current_file] = []
+        if classes and self.header_classes.issubset(classes):
+            header = [[], []]
+            self.headers.append(header)
+            self.pending.append(header)
+            self.open_headers.append(header)
+        elif tag == 'table' and self.table_classes.issubset(classes) and self.pending:
+            # The table belongs to every header seen since the previous one
+            table = [self.pending, []]
+            self.pending = []
+            self.open_tables.append(table)
         
-        table = header.find_next('table', class_=code_table_class)
-        if table:
-            added_lines = table.find_all('tr', class_=code_line_class)
-            
-            for line in added_lines:
-                # Extract code from the line, removing line numbers
-                code_spans = line.find_all('span')
-                if code_spans:
-                    # Skip the first span which contains the line number
-                    code_text = ''.join(span.get_text() for span in code_spans[1:])
-                else:
-                    # Fallback to get all text if no spans found
-                    code_text = line.get_text().strip()
-                    # Try to remove line numbers using regex
-                    code_text = re.sub(r'^\d+\s*', '', code_text)
-                
-                code_blocks[current_file].append(code_text)
+        if tag == 'tr' and self.open_tables and self.line_classes.issubset(classes):
+            # Reserve the line now so rows nested in rows keep document order
+            slots = []
+            for open_table in self.open_tables:
+                slots.append((open_table[1], len(open_table[1])))
+                open_table[1].append(None)
+            row = [[], [], [], slots]
+            self.open_rows.append(row)
+        elif tag == 'span' and self.open_rows:
+            is_span = True
+            for open_row in self.open_rows:
+                open_row[2].append(len(open_row[1]))
+                open_row[1].append([])
+        
+        self.stack.append((header, table, row, is_span, is_hidden))
     
-    files_created = []
-    for file_path, code_lines in code_blocks.items():
-        if not code_lines:
-            continue
+    def data(self, text):
+        if self.hidden_depth:
+            return
         
-        full_path = os.path.join(output_dir, file_path)
+        for header in self.open_headers:
+            header[0].append(text)
         
-        try:
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            
-            with open(full_path, 'w', encoding=encoding) as file:
-                file.write('\n'.join(code_lines))
-            
-            files_created.append(file_path)
-            logger.info(f"Created file: {file_path}")
-        except Exception as e:
-            logger.error(f"Error creating file {file_path}: {e}")
+        for row in self.open_rows:
+            row[0].append(text)
+            for span in row[2]:
+                row[1][span].append(text)
     
-    if progress_callback:
-        progress_callback(100)
+    def end(self, tag):
+        header, table, row, is_span, is_hidden = self.stack.pop()
+        
+        if is_hidden:
+            self.hidden_depth -= 1
+        
+        if is_span:
+            for open_row in self.open_rows:
+                open_row[2].pop()
+        
+        if row is not None:
+            self.open_rows.pop()
+            code_line = self._code_line(row)
+            for table_lines, index in row[3]:
+                table_lines[index] = code_line
+        
+        if table is not None:
+            self.open_tables.pop()
+            # Only headers sharing the table with the first one need copies of its lines
+            for table_header in table[0][1:]:
+                table_header[1] = list(table[1])
+            table[0][0][1] = table[1]
+        
+        if header is not None:
+            self.open_headers.pop()
     
-    return files_created
+    def _code_line(self, row):
+        # Full text of the line and its code without the line number
+        text = ''.join(row[0]).strip()
+        code_spans = row[1]
+        if code_spans:
+            # Skip the first span which contains the line number
+            return text, ''.join([''.join(span) for span in code_spans[1:]])
+        
+        # Fallback to get all text if no spans found
+        return text, LINE_NUMBER_RE.sub('', text)
+    
+    def close(self):
+        code_blocks = {}
+        for text_parts, code_lines in self.headers:
+            file_path = _clean_file_path(''.join(text_parts))
+            if file_path:
+                code_blocks[file_path] = code_lines
+        
+        return code_blocks, len(self.headers)
+
+def _lxml_code_lines(html_content, matchers, progress_callback):
+    header_classes = matchers[0]
+    if not header_classes or not html_content:
+        return {}, 0
+    
+    # huge_tree lifts libxml2's size limits for very large exports, as in the basic extractor
+    parser = etree.HTMLParser(target=_CodeLineCollector(matchers), huge_tree=True)
+    
+    # Feed the document in chunks so progress can be reported while parsing
+    total = len(html_content)
+    for offset in range(0, total, FEED_CHUNK_SIZE):
+        if progress_callback:
+            progress_callback(offset / total * 100)
+        parser.feed(html_content[offset:offset + FEED_CHUNK_SIZE])
+    
+    return parser.close()
 
-def preview_code_from_html(html_file_path, selectors, encoding="utf-8"):
+def _stream_code_lines(html_file_path, matchers, encoding, progress_callback):
+    # Decodes and parses the file a chunk at a time, so the page is never held in memory as a whole.
+    # Returns None when read_html has to take over (byte order mark, undecodable bytes, read errors).
+    if not matchers[0]:
+        return {}, 0
+    
     try:
-        with open(html_file_path, 'r', encoding=encoding) as file:
-            html_content = file.read()
-    except UnicodeDecodeError:
-        try:
-            with open(html_file_path, 'r', encoding='latin-1') as file:
-                html_content = file.read()
-            logger.warning(f"Fallback to latin-1 encoding for {html_file_path}")
-        except Exception as e:
-            logger.error(f"Error reading HTML file: {e}")
-            return {}
-    except Exception as e:
-        logger.error(f"Error reading HTML file: {e}")
-        return {}
+        decoder = codecs.getincrementaldecoder(encoding)()
+    except LookupError:
+        return None
     
-    soup = BeautifulSoup(html_content, 'html.parser')
+    parser = etree.HTMLParser(target=_CodeLineCollector(matchers), huge_tree=True)
+    try:
+        with open(html_file_path, 'rb') as file:
+            total = os.fstat(file.fileno()).st_size
+            chunk = file.read(FEED_CHUNK_SIZE)
+            if not chunk:
+                return {}, 0
+            if chunk[:4].startswith(BYTE_ORDER_MARKS):
+                return None
+            
+            offset = 0
+            while chunk:
+                if progress_callback:
+                    progress_callback(offset / total * 100)
+                offset += len(chunk)
+                parser.feed(decoder.decode(chunk))
+                chunk = file.read(FEED_CHUNK_SIZE)
+            parser.feed(decoder.decode(b'', final=True))
+    except (OSError, UnicodeError):
+        return None
     
-    code_blocks = {}
-    current_file = None
+    return parser.close()
+
+@functools.lru_cache(maxsize=32)
+def _compile_fast_line_pattern(code_line_class):
+    # Start tag of a code row: a double-quoted class attribute holding each of the classes, in any order
+    lookaheads = ''.join(rf'(?=[^"]*(?<![^\s"]){re.escape(name)}(?![^\s"]))' for name in code_line_class.split())
+    attrs = rf'[^>]*?\sclass\s*=\s*"{lookaheads}[^"]*"[^>]*' if lookaheads else r'[^>]*'
+    return re.compile(rf'<tr(?=[\s/>]){attrs}>')
+
+@functools.lru_cache(maxsize=32)
+def _compile_tag_patterns(tag_name):
+    # End tag of a header element, and a nested start tag of the same element
+    return re.compile(rf'</{tag_name}\s*>'), re.compile(rf'<{tag_name}(?=[\s/>])')
+
+def _fast_span_texts(row_html):
+    # Text of each span in the row, or None when spans are nested
+    span_texts = []
+    text_parts = None
+    position = 0
     
-    file_path_class = selectors["file_path_class"]
-    code_table_class = selectors["code_table_class"]
-    code_line_class = selectors["code_line_class"]
+    for tag in SPAN_TAG_RE.finditer(row_html):
+        if text_parts is not None:
+            text_parts.append(row_html[position:tag.start()])
+        
+        if tag.group(1):
+            if text_parts is None:
+                continue
+            span_texts.append(TAG_RE.sub('', ''.join(text_parts)))
+            text_parts = None
+        elif text_parts is None:
+            text_parts = []
+        else:
+            return None
+        
+        position = tag.end()
     
-    file_headers = soup.find_all(class_=re.compile(file_path_class))
+    return None if text_parts is not None else span_texts
+
+def _fast_row_cells_regular(row_html):
+    # Cells must open and close in turn; nested rows, table sections, captions, columns and
+    # cells opened inside cells are rearranged by parsers
+    tags = ROW_TABLE_TAG_RE.findall(row_html)
+    if len(tags) % 2:
+        return False
+    for (close, name), (end_close, end_name) in zip(tags[::2], tags[1::2]):
+        if close or not end_close or name != end_name or name not in ('td', 'th'):
+            return False
+    return True
+
+def _fast_code_line(row_html):
+    # Full text of the row and its code without the line number
+    text = html.unescape(TAG_RE.sub('', row_html)).strip()
+    if '<span' in row_html:
+        span_texts = TEXT_SPAN_RE.findall(row_html)
+        if len(span_texts) != row_html.count('<span'):
+            span_texts = _fast_span_texts(row_html)
+            if span_texts is None:
+                return None
+        
+        if span_texts:
+            # Skip the first span which contains the line number
+            if '&' not in row_html:
+                return text, ''.join(span_texts[1:])
+            return text, ''.join([html.unescape(span_text) for span_text in span_texts[1:]])
     
-    if not file_headers:
-        logger.warning("No file headers found. Check if the HTML structure matches the expected pattern.")
+    # Fallback to get all text if no spans found, removing the line number
+    return text, LINE_NUMBER_RE.sub('', text)
+
+def _fast_code_lines(html_content, selectors, progress_callback):
+    # Harvests headers and code rows with plain string searches and regexes instead of
+    # building a tree. Only markup the patterns fully account for is accepted; None means
+    # a parser is needed.
+    header_names = selectors["file_path_class"].split()
+    if not header_names:
+        return {}, 0
+    header_classes = frozenset(header_names)
+    table_classes = frozenset(selectors["code_table_class"].split())
+    if not table_classes:
+        return None
+    line_re = _compile_fast_line_pattern(selectors["code_line_class"])
+    
+    # Headers are found through their longest class name, which is the least common text
+    marker = max(header_names, key=len)
     
-    for header in file_headers:
-        file_path = header.get_text().strip()
+    # Parsers normalize line breaks and leave comment, script and style text out of the page text
+    if '\r' in html_content:
+        html_content = html_content.replace('\r\n', '\n').replace('\r', '\n')
+    html_content = HIDDEN_MARKUP_RE.sub('', html_content)
+    for pattern in (UNQUOTED_CLASS_RE, CLASS_ENTITY_RE, DUPLICATE_CLASS_RE, QUOTED_VALUE_RE):
+        if pattern.search(html_content):
+            return None
+    # Counting is much cheaper than the case pattern and rules it out on most pages
+    if html_content.lower().count('class') != html_content.count('class') and CLASS_CASE_RE.search(html_content):
+        return None
+    
+    irregular = []
+    for tag in TAG_CHECK_RE.finditer(html_content):
+        if tag.group(1):
+            return None
+        irregular.append(tag.start())
+    
+    def classify(tag_start, class_position):
+        # Start tag at tag_start and whether it is a header or a code table; class_position,
+        # when given, must fall inside the tag's class attribute
+        tag = START_TAG_RE.match(html_content, tag_start)
+        if tag is None:
+            return None, None
+        class_attr = CLASS_ATTR_RE.search(html_content, tag_start, tag.end())
+        if class_attr is None:
+            return tag, None
+        if class_position is not None and not class_attr.start(1) <= class_position < class_attr.end(1):
+            return tag, None
+        
+        classes = class_attr.group(1).split()
+        if header_classes.issubset(classes):
+            return tag, 'header'
+        if tag.group(1) == 'table' and table_classes.issubset(classes):
+            return tag, 'table'
+        return tag, None
+    
+    def is_regular(start, end):
+        # No nested tables, headers or markup needing a parser between start and end
+        if html_content.find('<table', start, end) != -1:
+            return False
+        if bisect.bisect_left(irregular, start) != bisect.bisect_left(irregular, end):
+            return False
+        
+        position = html_content.find(marker, start, end)
+        while position != -1:
+            if classify(html_content.rfind('<', 0, position), position)[1] == 'header':
+                return False
+            position = html_content.find(marker, position + 1, end)
+        return True
+    
+    nodes = []
+    position = 0
+    while True:
+        header_at = html_content.find(marker, position)
+        table_at = html_content.find('<table', position)
+        if header_at == -1 and table_at == -1:
+            break
         
-        if file_path.endswith(':'):
-            file_path = file_path[:-1]  
+        if table_at != -1 and (header_at == -1 or table_at < header_at):
+            tag, kind = classify(table_at, None)
+            skip_to = table_at + 1
+        else:
+            tag, kind = classify(html_content.rfind('<', 0, header_at), header_at)
+            skip_to = header_at + 1
         
-        if not file_path:
+        if kind is None:
+            position = skip_to
+            continue
+        
+        if kind == 'header':
+            end_tag_re, start_tag_re = _compile_tag_patterns(tag.group(1))
+            end = end_tag_re.search(html_content, tag.end())
+            if end is None or not is_regular(tag.end(), end.start()):
+                return None
+            inner = html_content[tag.end():end.start()]
+            if start_tag_re.search(inner):
+                return None
+            if '<' in inner and not all(name.lower() in HEADER_INNER_TAGS
+                                        for name in INNER_TAG_RE.findall(inner)):
+                return None
+            
+            nodes.append((True, html.unescape(TAG_RE.sub('', inner))))
+            position = end.end()
             continue
         
-        current_file = file_path
-        code_blocks[current_file] = []
+        end = TABLE_END_RE.search(html_content, tag.end())
+        if end is None or not is_regular(tag.end(), end.start()):
+            return None
         
-        table = header.find_next('table', class_=code_table_class)
-        if table:
-            added_lines = table.find_all('tr', class_=code_line_class)
+        code_lines = []
+        append = code_lines.append
+        for line in line_re.finditer(html_content, tag.end(), end.start()):
+            line_end = ROW_END_RE.search(html_content, line.end(), end.start())
+            if line_end is None:
+                return None
+            row_html = html_content[line.end():line_end.start()]
+            if not _fast_row_cells_regular(row_html):
+                return None
             
-            for line in added_lines:
-                code_text = line.get_text().strip()
-                code_blocks[current_file].append(code_text)
+            code_line = _fast_code_line(row_html)
+            if code_line is None:
+                return None
+            append(code_line)
+        
+        nodes.append((False, code_lines))
+        position = end.end()
+    
+    return _pair_code_blocks(nodes, [header for header, _ in nodes],
+                             lambda node: node[1], lambda node: node[1], progress_callback)
+
+def _lacks_file_headers(html_file_path, header_classes, encoding):
+    # True when some header class name occurs nowhere in the raw file, so there is nothing to parse.
+    # Only ASCII class names in ASCII-compatible encodings without a byte order mark are checked;
+    # anything else might have headers.
+    try:
+        if '<a'.encode(encoding, 'replace') != b'<a':
+            return False
+        names = [name.encode('ascii') for name in header_classes]
+        with open(html_file_path, 'rb') as file:
+            if not os.fstat(file.fileno()).st_size:
+                return False
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                if source[:4].startswith(BYTE_ORDER_MARKS):
+                    return False
+                return any(source.find(name) < 0 for name in names)
+    except (OSError, ValueError, LookupError):
+        # Let the read report the problem
+        return False
+
+def _collect_code_lines(html_file_path, selectors, encoding, progress_callback, fast_mode):
+    # Every code line is collected as (full row text, code without the line number),
+    # so previews and extraction can be served from one parse
+    matchers = _selector_matchers(selectors)
+    if _lacks_file_headers(html_file_path, matchers[0], encoding):
+        logger.warning("No file headers found. Check if the HTML structure matches the expected pattern.")
+        return {}
+    
+    if not fast_mode and LexborHTMLParser is None:
+        # Without selectolax the file can be parsed as it is read
+        result = _stream_code_lines(html_file_path, matchers, encoding, progress_callback)
+        if result is not None:
+            code_blocks, headers_found = result
+            if not headers_found:
+                logger.warning("No file headers found. Check if the HTML structure matches the expected pattern.")
+            return code_blocks
+    
+    html_content = read_html(html_file_path, encoding)
+    if html_content is None:
+        return None
+    
+    result = None
+    if fast_mode:
+        result = _fast_code_lines(html_content, selectors, progress_callback)
+        if result is None:
+            logger.info("Markup too irregular for fast mode, parsing the document instead")
+    
+    # selectolax's lexbor parser and CSS engine are the fastest option; without it the
+    # document is streamed through lxml, keeping only headers and code rows
+    if result is not None:
+        code_blocks, headers_found = result
+    elif LexborHTMLParser is not None:
+        code_blocks, headers_found = _selectolax_code_lines(html_content, matchers, progress_callback)
+    else:
+        code_blocks, headers_found = _lxml_code_lines(html_content, matchers, progress_callback)
+    
+    if not headers_found:
+        logger.warning("No file headers found. Check if the HTML structure matches the expected pattern.")
     
     return code_blocks
 
+def _split_code_lines(code_blocks):
+    # Full row texts for previews and code lines for extraction, interned as they are split
+    intern = sys.intern
+    text_blocks = {}
+    line_blocks = {}
+    for file_path, code_lines in code_blocks.items():
+        text_blocks[file_path] = [intern(text) if len(text) < INTERN_LINE_LENGTH else text for text, _ in code_lines]
+        line_blocks[file_path] = [intern(code) if len(code) < INTERN_LINE_LENGTH else code for _, code in code_lines]
+    return text_blocks, line_blocks
+
+def _parse_code_blocks(html_file_path, selectors, encoding, progress_callback, fast_mode):
+    # The parse shared by previews and extraction: (full row texts, code lines) for every file,
+    # or None when the file cannot be read
+    try:
+        stat = os.stat(html_file_path)
+    except OSError:
+        # Let the read report the error
+        code_blocks = _collect_code_lines(html_file_path, selectors, encoding, progress_callback, fast_mode)
+        return None if code_blocks is None else _split_code_lines(code_blocks)
+    
+    # Keyed by file identity and every option that changes the parse
+    key = (os.path.abspath(html_file_path), stat.st_mtime_ns, stat.st_size,
+           selectors["file_path_class"], selectors["code_table_class"], selectors["code_line_class"],
+           encoding, fast_mode)
+    with _parse_cache_lock:
+        entry = _parse_cache.get(key)
+        if entry is not None:
+            _parse_cache.move_to_end(key)
+            return entry
+    
+    code_blocks = _collect_code_lines(html_file_path, selectors, encoding, progress_callback, fast_mode)
+    if code_blocks is None:
+        return None
+    
+    entry = _split_code_lines(code_blocks)
+    with _parse_cache_lock:
+        _parse_cache[key] = entry
+        if len(_parse_cache) > PARSE_CACHE_SIZE:
+            _parse_cache.popitem(last=False)
+    
+    return entry
+
+def collect_code_lines(html_file_path, selectors, encoding="utf-8", strip_line_numbers=True, progress_callback=None,
+                       fast_mode=False):
+    entry = _parse_code_blocks(html_file_path, selectors, encoding, progress_callback, fast_mode)
+    if entry is None:
+        return None
+    
+    return dict(entry[1] if strip_line_numbers else entry[0])
+
+def _write_code_file(full_path, code_lines, encoding):
+    # Encode once and write the bytes straight to a raw file descriptor, bypassing the
+    # buffered I/O layer; line endings are translated the same way text mode would
+    text = '\n'.join(code_lines)
+    if os.linesep != '\n':
+        text = text.replace('\n', os.linesep)
+    data = memoryview(text.encode(encoding))
+    
+    fd = os.open(full_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | WRITE_FLAGS, 0o666)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+def extract_code_from_html(html_file_path, output_dir, selectors, encoding="utf-8", progress_callback=None, fast_mode=False):
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # Parsing fills the first half of the progress range and writing the second
+    def parse_progress(value):
+        progress_callback(value / 2)
+    
+    entry = _parse_code_blocks(html_file_path, selectors, encoding,
+                               parse_progress if progress_callback else None, fast_mode)
+    if entry is None:
+        return []
+    code_blocks = entry[1]
+    
+    blocks = [(file_path, os.path.join(output_dir, file_path), code_lines)
+              for file_path, code_lines in code_blocks.items() if code_lines]
+    
+    # Create each directory once, parents first; a failure shows up as a write error below
+    for directory in sorted({os.path.dirname(full_path) for _, full_path, _ in blocks}, key=len):
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            logger.error(f"Error creating directory {directory}: {e}")
+    
+    def write_one(block):
+        _, full_path, code_lines = block
+        try:
+            _write_code_file(full_path, code_lines, encoding)
+        except Exception as e:
+            return e
+        return None
+    
+    # Writes release the GIL, so threads overlap them;
+    # results are logged from this thread in the original order
+    files_created = []
+    # Individual files are only logged at debug level; one summary line is logged at info level
+    log_files = logger.isEnabledFor(logging.DEBUG)
+    with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as executor:
+        results = zip(blocks, executor.map(write_one, blocks))
+        for i, ((file_path, _, _), error) in enumerate(results, 1):
+            if error:
+                logger.error(f"Error creating file {file_path}: {error}")
+            else:
+                files_created.append(file_path)
+                if log_files:
+                    logger.debug(f"Created file: {file_path}")
+            
+            if progress_callback:
+                progress_callback(50 + i / len(blocks) * 50)
+    
+    logger.info(f"Created {len(files_created)} files in {output_dir}")
+    
+    if progress_callback:
+        progress_callback(100)
+    
+    return files_created
+
+def preview_code_from_html(html_file_path, selectors, encoding="utf-8", fast_mode=False):
+    entry = _parse_code_blocks(html_file_path, selectors, encoding, None, fast_mode)
+    if entry is None:
+        return {}
+    
+    # Previews show the full rows, line numbers included
+    return dict(entry[0])
+
 class HTMLExtractorApp:
     def __init__(self, root):
         self.root = root
@@ -248,6 +874,13 @@ class HTMLExtractorApp:
         self.progress_var = tk.DoubleVar()
         self.progress_bar = ttk.Progressbar(self.status_frame, variable=self.progress_var, length=100, mode='determinate')
         self.progress_bar.pack(side=tk.RIGHT, padx=5)
+        
+        # Progress values pushed by extraction threads; None marks the end of an extraction
+        self.progress_queue = queue.Queue()
+        
+        # (handler, args) pairs from worker threads, run on the Tk thread by poll_results
+        self.result_queue = queue.Queue()
+        self.root.after(RESULT_POLL_MS, self.poll_results)
     
     def setup_main_tab(self):
         main_frame = ttk.Frame(self.main_tab, padding="10")
@@ -278,6 +911,10 @@ class HTMLExtractorApp:
         encoding_combo['values'] = ('utf-8', 'latin-1', 'cp1252', 'iso-8859-1', 'utf-16')
         encoding_combo.grid(row=0, column=1, sticky=tk.W, padx=5, pady=5)
         
+        self.fast_mode_var = tk.BooleanVar(value=self.config.get("parsing", {}).get("fast_mode", False))
+        ttk.Checkbutton(options_frame, text="Fast mode (regular markup only)",
+                        variable=self.fast_mode_var).grid(row=1, column=0, columnspan=2, sticky=tk.W, padx=5, pady=5)
+        
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill=tk.X, pady=20)
         
@@ -360,6 +997,7 @@ class HTMLExtractorApp:
         self.config["selectors"]["code_line_class"] = self.code_line_class_var.get()
         self.config["ui"]["window_size"] = self.window_size_var.get()
         self.config["output"]["encoding"] = self.encoding_var.get()
+        self.config.setdefault("parsing", {})["fast_mode"] = self.fast_mode_var.get()
         
         save_config(self.config)
         
@@ -375,19 +1013,50 @@ class HTMLExtractorApp:
             self.window_size_var.set(self.config["ui"]["window_size"])
             self.encoding_var.set(self.config["output"]["encoding"])
             self.output_path_var.set(self.config["output"]["default_dir"])
+            self.fast_mode_var.set(self.config["parsing"]["fast_mode"])
             
             save_config(self.config)
             
             messagebox.showinfo("Settings Reset", "Settings have been reset to defaults.")
     
     def update_progress(self, value):
-        self.progress_var.set(value)
-        self.root.update_idletasks()
+        # Called from the extraction thread; only the Tk thread touches widgets
+        self.progress_queue.put(value)
+    
+    def poll_progress(self):
+        # Apply the latest queued value once per poll instead of once per file
+        value = None
+        finished = False
+        while True:
+            try:
+                queued = self.progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            if queued is None:
+                finished = True
+            else:
+                value = queued
+        
+        if value is not None:
+            self.progress_var.set(value)
+        if not finished:
+            self.root.after(PROGRESS_POLL_MS, self.poll_progress)
+    
+    def poll_results(self):
+        while True:
+            try:
+                handler, args = self.result_queue.get_nowait()
+            except queue.Empty:
+                break
+            handler(*args)
+        
+        self.root.after(RESULT_POLL_MS, self.poll_results)
     
     def extract_code(self):
         html_file = self.file_path_var.get()
         output_dir = self.output_path_var.get()
         encoding = self.encoding_var.get()
+        fast_mode = self.fast_mode_var.get()
         
         if not html_file:
             messagebox.showerror("Error", "Please select an HTML file")
@@ -413,14 +1082,19 @@ class HTMLExtractorApp:
                     output_dir, 
                     selectors, 
                     encoding=encoding,
-                    progress_callback=self.update_progress
+                    progress_callback=self.update_progress,
+                    fast_mode=fast_mode
                 )
                 
-                self.root.after(0, lambda: self.extraction_complete(files_created, output_dir))
+                self.result_queue.put((self.extraction_complete, (files_created, output_dir)))
             except Exception as e:
-                self.root.after(0, lambda: self.extraction_error(str(e)))
+                self.result_queue.put((self.extraction_error, (str(e),)))
+            finally:
+                self.progress_queue.put(None)
         
+        self.progress_var.set(0)
         threading.Thread(target=extraction_thread).start()
+        self.root.after(PROGRESS_POLL_MS, self.poll_progress)
     
     def extraction_complete(self, files_created, output_dir):
         if files_created:
@@ -437,6 +1111,7 @@ class HTMLExtractorApp:
     def preview_code(self):
         html_file = self.file_path_var.get()
         encoding = self.encoding_var.get()
+        fast_mode = self.fast_mode_var.get()
         
         if not html_file:
             messagebox.showerror("Error", "Please select an HTML file")
@@ -460,12 +1135,13 @@ class HTMLExtractorApp:
                 preview_data = preview_code_from_html(
                     html_file, 
                     selectors, 
-                    encoding=encoding
+                    encoding=encoding,
+                    fast_mode=fast_mode
                 )
                 
-                self.root.after(0, lambda: self.preview_complete(preview_data))
+                self.result_queue.put((self.preview_complete, (preview_data,)))
             except Exception as e:
-                self.root.after(0, lambda: self.preview_error(str(e)))
+                self.result_queue.put((self.preview_error, (str(e),)))
         
         threading.Thread(target=preview_thread).start()
     
@@ -476,10 +1152,9 @@ class HTMLExtractorApp:
         
         self.file_listbox.delete(0, tk.END)
         
-        for file_path in preview_data.keys():
-            self.file_listbox.insert(tk.END, file_path)
-        
         if preview_data:
+            # One Tcl call for the whole list rather than one per file
+            self.file_listbox.insert(tk.END, *preview_data)
             self.status_var.set(f"Preview ready: {len(preview_data)} files found")
         else:
             self.status_var.set("No files found for preview")
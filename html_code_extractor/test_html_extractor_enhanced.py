@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+import random
+import unittest
+
+import html_extractor_enhanced as extractor
+
+SELECTORS = {
+    "file_path_class": "text-sm text-zinc-400 mb-2 font-mono",
+    "code_table_class": "syntax-highlight",
+    "code_line_class": "line added"
+}
+
+ROW = '<tr class="line added"><td><span>{number}</span></td><td><span>{code}</span></td></tr>'
+
+def page(rows, header='<div class="text-sm text-zinc-400 mb-2 font-mono">src/a.py</div>'):
+    return (f'<html><body>{header}<table class="syntax-highlight"><tbody>{"".join(rows)}</tbody></table>'
+            f'</body></html>')
+
+def regular_rows():
+    return [ROW.format(number=1, code='x = 1'), ROW.format(number=2, code='y = x &amp;&amp; 2')]
+
+class FastModeTest(unittest.TestCase):
+    # Fast mode must either match a full parse or return None so the page is parsed
+
+    def assertMatchesParse(self, html_content):
+        fast = extractor._fast_code_lines(html_content, SELECTORS, None)
+        if fast is not None:
+            parsed = extractor._lxml_code_lines(html_content, extractor._selector_matchers(SELECTORS), None)
+            self.assertEqual(fast, parsed, html_content)
+        return fast
+
+    def test_regular_markup(self):
+        fast = self.assertMatchesParse(page(regular_rows()))
+        self.assertEqual(fast, ({'src/a.py': [('1x = 1', 'x = 1'), ('2y = x && 2', 'y = x && 2')]}, 1))
+
+    def test_mixed_case_tags(self):
+        rows = ['<tr class="line added"><td><sPan>1</sPan></td><td><span>x = 1</span></td></tr>']
+        self.assertIsNone(self.assertMatchesParse(page(rows)))
+        self.assertIsNone(self.assertMatchesParse(page(regular_rows() + ['<tD></tD>'])))
+
+    def test_table_markup_in_rows(self):
+        for markup in ('<tbody>', '</tbody>', '<thead>', '<tfoot>', '<td>', '</td>', '<th>', '<caption>',
+                       '<col>', '<colgroup>', '<tr>'):
+            rows = regular_rows()
+            rows[0] = rows[0].replace('</span></td></tr>', f'</span>{markup}z</td></tr>')
+            self.assertIsNone(self.assertMatchesParse(page(rows)), markup)
+
+    def test_attributes(self):
+        for old, new in (('<table ', '<table data-x="a>b" '), ('<tr class', '<tr cLass'),
+                         ('line added', 'line&#32;added'), ('<tr class', '<tr class="x" class'),
+                         ('<td>', '<td title=\'<\'>')):
+            self.assertIsNone(self.assertMatchesParse(page(regular_rows()).replace(old, new, 1)), new)
+
+    def test_block_in_header(self):
+        header = '<p class="text-sm text-zinc-400 mb-2 font-mono"><div>src/a.py</div></p>'
+        self.assertIsNone(self.assertMatchesParse(page(regular_rows(), header)))
+
+    def test_injected_markup(self):
+        snippets = ['<td>', '</td>', '<th>', '</th>', '<tbody>', '</tbody>', '<thead>', '<tfoot>', '<caption>',
+                    '<col>', '<TD>', '<Span>', '</sPan>', '<span>', '</span>', '<b>', '<p>', '<div>', '</div>',
+                    '<!-- c -->', '<br>', '&amp;', '<table>', '</table>', '<tr class="line added">', '</tr>']
+        rng = random.Random(0)
+        accepted = 0
+        for _ in range(500):
+            html_content = page(regular_rows())
+            for _ in range(rng.randint(1, 2)):
+                positions = [i for i, char in enumerate(html_content) if char == '<']
+                position = rng.choice(positions)
+                html_content = html_content[:position] + rng.choice(snippets) + html_content[position:]
+            if self.assertMatchesParse(html_content) is not None:
+                accepted += 1
+        # Harmless injections must still be taken by fast mode
+        self.assertGreater(accepted, 0)
+
+if __name__ == '__main__':
+    unittest.main()